@@ -0,0 +1,332 @@
+from datetime import datetime, timedelta
+from sqlalchemy import select, insert, delete, func
+from database import metric_chunks, Container, release_free_pages
+from config import settings
+import calendar
+import struct
+import math
+import time
+import logging
+
+try:
+    import numpy
+except ImportError:  # optional: chunks decode in pure Python without it
+    numpy = None
+
+logger = logging.getLogger(__name__)
+
+# Each series is packed into chunks covering this many seconds of samples
+CHUNK_SECONDS = 7200
+
+# Missing values are stored as this NaN and read back as None
+MISSING_BITS = 0x7ff8000000000000
+
+class BitWriter:
+    def __init__(self):
+        self.parts = []
+    
+    def write(self, value, bits):
+        self.parts.append(format(value, f"0{bits}b"))
+    
+    def getvalue(self):
+        bits = "".join(self.parts)
+        if not bits:
+            return b""
+        bits += "0" * (-len(bits) % 8)
+        return int(bits, 2).to_bytes(len(bits) // 8, "big")
+
+class BitReader:
+    def __init__(self, data):
+        self.bits = format(int.from_bytes(data, "big"), f"0{len(data) * 8}b") if data else ""
+        self.pos = 0
+    
+    def read(self, bits):
+        value = int(self.bits[self.pos:self.pos + bits], 2)
+        self.pos += bits
+        return value
+    
+    def read_bit(self):
+        bit = self.bits[self.pos] == "1"
+        self.pos += 1
+        return bit
+
+# Delta-of-delta buckets: (control bits, control length, value bits)
+DOD_BUCKETS = [(0b10, 2, 7), (0b110, 3, 9), (0b1110, 4, 12), (0b1111, 4, 32)]
+
+def float_bits(value):
+    if value is None:
+        return MISSING_BITS
+    return struct.unpack("<Q", struct.pack("<d", value))[0]
+
+def encode_timestamps(writer, timestamps):
+    """Epoch seconds as the first value, then Gorilla delta-of-delta codes"""
+    writer.write(timestamps[0], 64)
+    previous, previous_delta = timestamps[0], 0
+    for timestamp in timestamps[1:]:
+        delta = timestamp - previous
+        dod = delta - previous_delta
+        if dod == 0:
+            writer.write(0, 1)
+        else:
+            for control, control_bits, bits in DOD_BUCKETS:
+                offset = (1 << (bits - 1)) - 1
+                if -offset <= dod <= offset + 1 or bits == 32:
+                    writer.write(control, control_bits)
+                    writer.write(dod + offset, bits)
+                    break
+        previous, previous_delta = timestamp, delta
+
+def encode_values(writer, values):
+    """First value verbatim, then each value XORed with the previous (Gorilla float compression)"""
+    previous = float_bits(values[0])
+    writer.write(previous, 64)
+    previous_leading = previous_trailing = None
+    for value in values[1:]:
+        bits = float_bits(value)
+        xor = bits ^ previous
+        if xor == 0:
+            writer.write(0, 1)
+        else:
+            leading = min(64 - xor.bit_length(), 31)
+            trailing = (xor & -xor).bit_length() - 1
+            if previous_leading is not None and leading >= previous_leading and trailing >= previous_trailing:
+                # Meaningful bits fit in the previous window
+                writer.write(0b10, 2)
+                writer.write(xor >> previous_trailing, 64 - previous_leading - previous_trailing)
+            else:
+                length = 64 - leading - trailing
+                writer.write(0b11, 2)
+                writer.write(leading, 5)
+                writer.write(length - 1, 6)
+                writer.write(xor >> trailing, length)
+                previous_leading, previous_trailing = leading, trailing
+        previous = bits
+
+def decode_timestamps(reader, count):
+    first = reader.read(64)
+    dods = []
+    for _ in range(count - 1):
+        if not reader.read_bit():
+            dods.append(0)
+            continue
+        # Control bits are a unary prefix: 10, 110, 1110, 1111
+        for bucket, (_, _, bits) in enumerate(DOD_BUCKETS):
+            if bucket == len(DOD_BUCKETS) - 1 or not reader.read_bit():
+                break
+        offset = (1 << (bits - 1)) - 1
+        dods.append(reader.read(bits) - offset)
+    
+    if numpy is not None:
+        deltas = numpy.cumsum(numpy.array(dods, dtype=numpy.int64))
+        return [first] + (first + numpy.cumsum(deltas)).tolist()
+    timestamps = [first]
+    delta = 0
+    for dod in dods:
+        delta += dod
+        timestamps.append(timestamps[-1] + delta)
+    return timestamps
+
+def decode_values(reader, count):
+    xors = [reader.read(64)]
+    leading = trailing = 0
+    for _ in range(count - 1):
+        if not reader.read_bit():
+            xors.append(0)
+            continue
+        if reader.read_bit():
+            leading = reader.read(5)
+            length = reader.read(6) + 1
+            trailing = 64 - leading - length
+        xors.append(reader.read(64 - leading - trailing) << trailing)
+    
+    # The XORs are a prefix-XOR of the stored bit patterns
+    if numpy is not None:
+        values = numpy.bitwise_xor.accumulate(numpy.array(xors, dtype=numpy.uint64)).view(numpy.float64).tolist()
+    else:
+        patterns = []
+        bits = 0
+        for xor in xors:
+            bits ^= xor
+            patterns.append(bits)
+        values = struct.unpack(f"<{count}d", struct.pack(f"<{count}Q", *patterns))
+    return [None if math.isnan(value) else value for value in values]
+
+def encode_chunk(timestamps, columns):
+    """Pack epoch-second timestamps and one list of values per field into one bitstream"""
+    writer = BitWriter()
+    encode_timestamps(writer, timestamps)
+    for values in columns:
+        encode_values(writer, values)
+    return writer.getvalue()
+
+def decode_chunk(data, count, field_count):
+    reader = BitReader(data)
+    timestamps = decode_timestamps(reader, count)
+    return timestamps, [decode_values(reader, count) for _ in range(field_count)]
+
+def to_seconds(value):
+    return calendar.timegm(value.timetuple())
+
+def chunk_query(kind, start=None, end=None, keys=None):
+    """Chunks of a kind overlapping [start, end); container chunks carry their id and name"""
+    query = select(metric_chunks).where(metric_chunks.c.kind == kind.name)
+    if kind.key_field:
+        containers = Container.__table__
+        query = select(metric_chunks, containers.c.container_id, containers.c.container_name).join(
+            containers, containers.c.id == metric_chunks.c.series_key
+        ).where(metric_chunks.c.kind == kind.name)
+        if keys:
+            query = query.where(containers.c.container_id.in_(keys))
+    if start is not None:
+        query = query.where(metric_chunks.c.end > start)
+    if end is not None:
+        query = query.where(metric_chunks.c.start < end)
+    return query
+
+def list_columns(field, samples, timestamps):
+    """Chunk fields and value columns for a list field, one <field>.<n> series per list position"""
+    lists = [samples[timestamp].get(field) or [] for timestamp in timestamps]
+    width = max(map(len, lists), default=0)
+    return (
+        [f"{field}.{position}" for position in range(width)],
+        [[values[position] if position < len(values) else None for values in lists] for position in range(width)]
+    )
+
+def chunk_samples(chunk, kind):
+    """Decode one chunk row into sample dicts in time order"""
+    fields = chunk["fields"].split(",")
+    timestamps, columns = decode_chunk(chunk["data"], chunk["sample_count"], len(fields))
+    scalars = [(field, values) for field, values in zip(fields, columns) if "." not in field]
+    positions = {}  # list field -> value columns in position order
+    for field, values in zip(fields, columns):
+        if "." in field:
+            positions.setdefault(field.split(".")[0], []).append(values)
+    samples = []
+    for i, timestamp in enumerate(timestamps):
+        sample = dict.fromkeys(kind.fields + kind.list_fields)
+        sample["timestamp"] = datetime.utcfromtimestamp(timestamp)
+        for field, values in scalars:
+            sample[field] = values[i]
+        for field, position_values in positions.items():
+            values = [values[i] for values in position_values]
+            # A sample with fewer entries than the widest one in its chunk is padded with None
+            while values and values[-1] is None:
+                values.pop()
+            sample[field] = values or None
+        if kind.key_field:
+            sample[kind.key_field] = chunk["series_key"]
+        samples.append(sample)
+    return samples
+
+def chunk_rows(conn, kind, start, end, keys=None):
+    """Raw rows of a kind in [start, end) read back from compressed chunks, in time order"""
+    rows = []
+    for chunk in conn.execute(chunk_query(kind, start, end, keys)):
+        chunk = chunk._mapping
+        for sample in chunk_samples(chunk, kind):
+            if start <= sample["timestamp"] < end:
+                if kind.key_field:
+                    sample["container_id"] = chunk["container_id"]
+                    sample["container_name"] = chunk["container_name"]
+                rows.append(sample)
+    rows.sort(key=lambda row: row["timestamp"])
+    return rows
+
+def first_chunk_timestamp(conn, kind):
+    return conn.execute(
+        select(func.min(metric_chunks.c.start)).where(metric_chunks.c.kind == kind.name)
+    ).scalar()
+
+class ChunkCompactor:
+    """Packs raw day partitions older than chunk_after_days into compressed chunks.
+    A kind's list fields (host cpu_per_core) are kept as one series per list position."""
+    
+    def __init__(self, engine, kinds):
+        self.engine = engine
+        self.kinds = kinds
+    
+    def run(self):
+        cutoff = datetime.utcnow() - timedelta(days=settings.chunk_after_days)
+        compacted = 0
+        for kind in self.kinds:
+            with self.engine.connect() as conn:
+                days = kind.raw.days_before(conn, cutoff)
+            for day in days:
+                started = time.time()
+                with self.engine.begin() as conn:
+                    chunks = self.compact_day(conn, kind, day)
+                    kind.raw.drop_day(conn, day)
+                compacted += 1
+                logger.info(
+                    f"Compacted {kind.name} metrics of {day.isoformat()} into {chunks} chunks "
+                    f"in {(time.time() - started) * 1000:.1f}ms"
+                )
+        if compacted:
+            release_free_pages()
+    
+    def compact_day(self, conn, kind, day):
+        """Encode one day partition, merged with any chunks already stored for that day"""
+        day_start = datetime.combine(day, datetime.min.time())
+        day_end = day_start + timedelta(days=1)
+        series = {}  # series key -> {epoch second: {field: value}}
+        
+        # Rows written late for an already compacted day are merged into its chunks
+        existing = conn.execute(
+            select(metric_chunks).where(
+                metric_chunks.c.kind == kind.name,
+                metric_chunks.c.start >= day_start,
+                metric_chunks.c.start < day_end
+            )
+        ).all()
+        for chunk in existing:
+            chunk = chunk._mapping
+            samples = series.setdefault(chunk["series_key"], {})
+            for sample in chunk_samples(chunk, kind):
+                samples[to_seconds(sample.pop("timestamp"))] = sample
+        if existing:
+            conn.execute(
+                delete(metric_chunks).where(
+                    metric_chunks.c.kind == kind.name,
+                    metric_chunks.c.start >= day_start,
+                    metric_chunks.c.start < day_end
+                )
+            )
+        
+        table = kind.raw.table(day)
+        stored_fields = kind.fields + kind.list_fields
+        columns = [table.c.timestamp] + [table.c[f] for f in stored_fields]
+        if kind.key_field:
+            columns.append(table.c[kind.key_field])
+        for row in conn.execute(select(*columns)):
+            row = row._mapping
+            key = row[kind.key_field] if kind.key_field else 0
+            series.setdefault(key, {})[to_seconds(row["timestamp"])] = {f: row[f] for f in stored_fields}
+        
+        chunks = []
+        for key, samples in series.items():
+            windows = {}
+            for timestamp in sorted(samples):
+                windows.setdefault(timestamp - timestamp % CHUNK_SECONDS, []).append(timestamp)
+            for window_start, timestamps in windows.items():
+                fields = list(kind.fields)
+                values = [[samples[timestamp].get(field) for timestamp in timestamps] for field in kind.fields]
+                for field in kind.list_fields:
+                    list_fields, list_values = list_columns(field, samples, timestamps)
+                    fields.extend(list_fields)
+                    values.extend(list_values)
+                chunks.append({
+                    "kind": kind.name,
+                    "series_key": key,
+                    "start": window_start,
+                    "end": timestamps[-1] + 1,
+                    "sample_count": len(timestamps),
+                    "fields": ",".join(fields),
+                    "data": encode_chunk(timestamps, values)
+                })
+        if chunks:
+            conn.execute(insert(metric_chunks), chunks)
+        return len(chunks)
+    
+    def drop_before(self, conn, cutoff):
+        """Delete chunks whose samples are all older than cutoff"""
+        return conn.execute(delete(metric_chunks).where(metric_chunks.c.end <= cutoff)).rowcount
@@ -1,32 +1,170 @@
 import psutil
 import docker
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
-from database import HostMetric, ContainerMetric, SessionLocal, init_db
+from database import host_metrics, container_metrics, engine, init_db, release_free_pages, container_registry
 from config import settings
+from scheduler import Scheduler
+from writer import MetricsWriter
+from rollup import RollupJob, HOST, CONTAINER
+from chunks import ChunkCompactor
+from sizes import SizeScanner
+from logsearch import log_search
+from logindex import log_indexes
+from hub import metrics_hub
+from hotcache import hot_cache
 import time
 import threading
 import logging
+import json
 
 logger = logging.getLogger(__name__)
 
+class ContainerStatsStream:
+    """Keeps one long-lived stats(stream=True) subscription per running container"""
+    
+    def __init__(self, docker_client):
+        self.docker_client = docker_client
+        self.frames = {}  # container id -> (stats frame, received_at)
+        self.streams = {}  # container id -> stop event
+        self.lock = threading.Lock()
+    
+    def sync(self, containers):
+        """Subscribe to new containers and drop subscriptions for stopped ones"""
+        running_ids = {container.id for container in containers}
+        
+        with self.lock:
+            for container in containers:
+                if container.id not in self.streams:
+                    stop_event = threading.Event()
+                    self.streams[container.id] = stop_event
+                    threading.Thread(
+                        target=self._follow,
+                        args=(container.id, container.name, stop_event),
+                        name=f"stats-{container.name}",
+                        daemon=True
+                    ).start()
+                    logger.info(f"Subscribed to stats stream for container {container.name}")
+            
+            for container_id in list(self.streams):
+                if container_id not in running_ids:
+                    self.streams.pop(container_id).set()
+                    self.frames.pop(container_id, None)
+    
+    def _follow(self, container_id, container_name, stop_event):
+        """Decode frames from one container's stats stream until it ends or is dropped"""
+        try:
+            for frame in self.docker_client.api.stats(container_id, stream=True, decode=True):
+                if stop_event.is_set():
+                    break
+                # The first frame has no precpu sample to compute CPU from
+                if not frame.get('precpu_stats', {}).get('system_cpu_usage'):
+                    continue
+                with self.lock:
+                    self.frames[container_id] = (frame, time.time())
+        except Exception as e:
+            logger.warning(f"Stats stream for container {container_name} ended: {e}")
+        finally:
+            with self.lock:
+                # Let the next sync() resubscribe unless this stream was replaced
+                if self.streams.get(container_id) is stop_event:
+                    del self.streams[container_id]
+                    self.frames.pop(container_id, None)
+    
+    def latest(self, containers, max_age):
+        """Return (container, frame) pairs for containers with a fresh cached frame"""
+        now = time.time()
+        results = []
+        with self.lock:
+            for container in containers:
+                cached = self.frames.get(container.id)
+                if cached and now - cached[1] <= max_age:
+                    results.append((container, cached[0]))
+        return results
+
 class MetricsCollector:
     def __init__(self):
         self.docker_client = None
         self.last_disk_io = None
         self.last_network_io = None
+        self.last_cpu_times = None
+        self.last_per_cpu_times = None
         self.last_time = time.time()
+        self.stats_client = None
+        self.stats_executor = None
+        self.stats_stream = None
+        self.writer = MetricsWriter(
+            engine, settings.write_flush_size, settings.write_flush_latency, settings.write_buffer_max_rows
+        )
+        self.rollups = RollupJob(engine)
+        self.compactor = ChunkCompactor(engine, (HOST, CONTAINER))
+        self.sizes = SizeScanner(engine, settings.size_scan_concurrency)
         try:
             self.docker_client = docker.from_env()
             logger.info("Docker client initialized successfully")
         except Exception as e:
             logger.warning(f"Could not initialize Docker client: {e}")
+        
+        if self.docker_client and settings.collection_mode == "concurrent":
+            # Dedicated client so a hung stats call times out on its own socket
+            # and the pool has one connection per worker
+            try:
+                self.stats_client = docker.from_env(
+                    timeout=settings.container_stats_timeout,
+                    max_pool_size=settings.collector_max_workers
+                )
+                self.stats_executor = ThreadPoolExecutor(
+                    max_workers=settings.collector_max_workers,
+                    thread_name_prefix="container-stats"
+                )
+            except Exception as e:
+                logger.warning(f"Could not initialize concurrent stats collection: {e}")
+        
+        if self.docker_client and settings.collection_mode == "streaming":
+            try:
+                self.stats_stream = ContainerStatsStream(docker.from_env())
+            except Exception as e:
+                logger.warning(f"Could not initialize streaming stats collection: {e}")
     
-    def collect_host_metrics(self, db: Session):
-        """Collect host CPU, RAM, Disk I/O and Network metrics"""
+    @staticmethod
+    def cpu_percent_between(previous, current):
+        """Busy percentage between two cpu_times() samples, as psutil computes it"""
+        def totals(times):
+            # guest time is already included in user/nice on Linux
+            total = sum(times) - getattr(times, 'guest', 0) - getattr(times, 'guest_nice', 0)
+            idle = getattr(times, 'idle', 0) + getattr(times, 'iowait', 0)
+            return total, idle
+        
+        previous_total, previous_idle = totals(previous)
+        current_total, current_idle = totals(current)
+        total_delta = current_total - previous_total
+        idle_delta = current_idle - previous_idle
+        if total_delta <= 0:
+            return 0.0
+        return round(max(0.0, min(100.0, (total_delta - idle_delta) / total_delta * 100.0)), 2)
+    
+    def collect_host_metrics(self, timestamp):
+        """Collect host CPU, RAM, Disk I/O and Network metrics as a host_metrics row"""
         try:
-            # CPU & Memory
-            cpu_percent = psutil.cpu_percent(interval=1)
+            # CPU from counter deltas since the previous tick (no blocking sample)
+            cpu_times = psutil.cpu_times()
+            per_cpu_times = psutil.cpu_times(percpu=True)
+            
+            cpu_percent = 0.0
+            cpu_per_core = None
+            
+            if self.last_cpu_times:
+                cpu_percent = self.cpu_percent_between(self.last_cpu_times, cpu_times)
+            if self.last_per_cpu_times and len(self.last_per_cpu_times) == len(per_cpu_times):
+                cpu_per_core = [
+                    self.cpu_percent_between(previous, current)
+                    for previous, current in zip(self.last_per_cpu_times, per_cpu_times)
+                ]
+            
+            self.last_cpu_times = cpu_times
+            self.last_per_cpu_times = per_cpu_times
+            
+            load_1m, load_5m, load_15m = psutil.getloadavg()
             memory = psutil.virtual_memory()
             
             # Disk I/O
@@ -68,7 +206,8 @@ class MetricsCollector:
             self.last_network_io = net_io
             self.last_time = current_time
             
-            host_metric = HostMetric(
+            host_metric = dict(
+                timestamp=timestamp,
                 cpu_percent=cpu_percent,
                 memory_percent=memory.percent,
                 memory_used_mb=memory.used / (1024 * 1024),
@@ -76,109 +215,196 @@ class MetricsCollector:
                 disk_read_kb=round(disk_read_kb, 2),
                 disk_write_mb=round(disk_write_mb, 2),
                 network_in_mbit=round(network_in_mbit, 2),
-                network_out_mbit=round(network_out_mbit, 2)
+                network_out_mbit=round(network_out_mbit, 2),
+                cpu_per_core=cpu_per_core,
+                load_avg_1m=round(load_1m, 2),
+                load_avg_5m=round(load_5m, 2),
+                load_avg_15m=round(load_15m, 2)
             )
-            db.add(host_metric)
-            db.commit()
-            logger.info(f"Host metrics: CPU={cpu_percent}%, RAM={memory.percent}%, Disk R={disk_read_kb:.2f}KB/s W={disk_write_mb:.2f}MB/s, Net In={network_in_mbit:.2f}Mbit/s Out={network_out_mbit:.2f}Mbit/s")
+            logger.info(f"Host metrics: CPU={cpu_percent}%, Load={load_1m:.2f}, RAM={memory.percent}%, Disk R={disk_read_kb:.2f}KB/s W={disk_write_mb:.2f}MB/s, Net In={network_in_mbit:.2f}Mbit/s Out={network_out_mbit:.2f}Mbit/s")
+            return host_metric
         except Exception as e:
             logger.error(f"Error collecting host metrics: {e}")
-            db.rollback()
+            return None
+    
+    def build_container_metric(self, container, stats, timestamp):
+        """Build a container_metrics row from a decoded stats frame"""
+        # Calculate CPU percentage
+        cpu_delta = stats['cpu_stats']['cpu_usage']['total_usage'] - \
+                    stats['precpu_stats']['cpu_usage']['total_usage']
+        system_delta = stats['cpu_stats']['system_cpu_usage'] - \
+                       stats['precpu_stats']['system_cpu_usage']
+        
+        cpu_percent = 0.0
+        if system_delta > 0 and cpu_delta > 0:
+            cpu_percent = (cpu_delta / system_delta) * \
+                         len(stats['cpu_stats']['cpu_usage'].get('percpu_usage', [1])) * 100.0
+        
+        # Calculate memory percentage
+        memory_usage = stats['memory_stats'].get('usage', 0)
+        memory_limit = stats['memory_stats'].get('limit', 1)
+        memory_percent = (memory_usage / memory_limit) * 100.0 if memory_limit > 0 else 0.0
+        
+        return dict(
+            timestamp=timestamp,
+            container_id=container.id[:12],
+            container_name=container.name,
+            cpu_percent=round(cpu_percent, 2),
+            memory_percent=round(memory_percent, 2),
+            memory_used_mb=memory_usage / (1024 * 1024),
+            memory_limit_mb=memory_limit / (1024 * 1024)
+        )
     
-    def collect_container_metrics(self, db: Session):
-        """Collect container CPU and RAM metrics"""
+    def _fetch_stats_sequential(self, containers):
+        """Fetch one stats frame per container, one container at a time"""
+        results = []
+        for container in containers:
+            try:
+                results.append((container, container.stats(stream=False)))
+            except Exception as e:
+                logger.error(f"Error collecting metrics for container {container.name}: {e}")
+        return results
+    
+    def _fetch_stats_concurrent(self, containers):
+        """Fetch stats frames on the worker pool, skipping containers that time out"""
+        futures = {
+            self.stats_executor.submit(
+                self.stats_client.api.stats, container.id, stream=False
+            ): container
+            for container in containers
+        }
+        
+        # Every worker gets a full timeout for each batch it has to run
+        batches = -(-len(containers) // settings.collector_max_workers)
+        done, not_done = wait(futures, timeout=settings.container_stats_timeout * max(batches, 1))
+        
+        results = []
+        for future in done:
+            container = futures[future]
+            try:
+                results.append((container, future.result()))
+            except Exception as e:
+                logger.error(f"Error collecting metrics for container {container.name}: {e}")
+        
+        if not_done:
+            for future in not_done:
+                future.cancel()
+            skipped = sorted(futures[future].name for future in not_done)
+            logger.warning(f"Skipped {len(skipped)} slow containers this tick: {', '.join(skipped)}")
+        
+        return results
+    
+    def collect_container_metrics(self, timestamp):
+        """Collect container CPU and RAM metrics as container_metrics rows"""
+        rows = []
         if not self.docker_client:
             logger.warning("Docker client not available, skipping container metrics")
-            return
+            return rows
         
         try:
+            started = time.time()
             containers = self.docker_client.containers.list()
             
-            for container in containers:
+            if self.stats_stream:
+                self.stats_stream.sync(containers)
+                results = self.stats_stream.latest(containers, max_age=settings.container_stats_timeout)
+            elif self.stats_executor:
+                results = self._fetch_stats_concurrent(containers)
+            else:
+                results = self._fetch_stats_sequential(containers)
+            
+            for container, stats in results:
                 try:
-                    stats = container.stats(stream=False)
-                    
-                    # Calculate CPU percentage
-                    cpu_delta = stats['cpu_stats']['cpu_usage']['total_usage'] - \
-                                stats['precpu_stats']['cpu_usage']['total_usage']
-                    system_delta = stats['cpu_stats']['system_cpu_usage'] - \
-                                   stats['precpu_stats']['system_cpu_usage']
-                    
-                    cpu_percent = 0.0
-                    if system_delta > 0 and cpu_delta > 0:
-                        cpu_percent = (cpu_delta / system_delta) * \
-                                     len(stats['cpu_stats']['cpu_usage'].get('percpu_usage', [1])) * 100.0
-                    
-                    # Calculate memory percentage
-                    memory_usage = stats['memory_stats'].get('usage', 0)
-                    memory_limit = stats['memory_stats'].get('limit', 1)
-                    memory_percent = (memory_usage / memory_limit) * 100.0 if memory_limit > 0 else 0.0
-                    
-                    container_metric = ContainerMetric(
-                        container_id=container.id[:12],
-                        container_name=container.name,
-                        cpu_percent=round(cpu_percent, 2),
-                        memory_percent=round(memory_percent, 2),
-                        memory_used_mb=memory_usage / (1024 * 1024),
-                        memory_limit_mb=memory_limit / (1024 * 1024)
-                    )
-                    db.add(container_metric)
-                    
+                    rows.append(self.build_container_metric(container, stats, timestamp))
                 except Exception as e:
                     logger.error(f"Error collecting metrics for container {container.name}: {e}")
                     continue
             
-            db.commit()
-            logger.info(f"Container metrics collected for {len(containers)} containers")
+            logger.info(f"Container metrics collected for {len(rows)}/{len(containers)} containers in {time.time() - started:.2f}s")
         except Exception as e:
             logger.error(f"Error collecting container metrics: {e}")
-            db.rollback()
+        return rows
     
-    def cleanup_old_data(self, db: Session):
-        """Remove data older than retention period"""
+    def cleanup_old_data(self):
+        """Drop the day partitions that are entirely older than the retention period"""
         try:
             cutoff_date = datetime.utcnow() - timedelta(days=settings.data_retention_days)
             
-            deleted_host = db.query(HostMetric).filter(HostMetric.timestamp < cutoff_date).delete()
-            deleted_container = db.query(ContainerMetric).filter(ContainerMetric.timestamp < cutoff_date).delete()
-            
-            db.commit()
+            with engine.begin() as conn:
+                dropped_host = host_metrics.drop_before(conn, cutoff_date)
+                dropped_container = container_metrics.drop_before(conn, cutoff_date)
+                deleted_chunks = self.compactor.drop_before(conn, cutoff_date)
             
-            if deleted_host > 0 or deleted_container > 0:
-                logger.info(f"Cleaned up old data: {deleted_host} host metrics, {deleted_container} container metrics")
+            if dropped_host > 0 or dropped_container > 0 or deleted_chunks > 0:
+                release_free_pages()
+                logger.info(
+                    f"Cleaned up old data: {dropped_host} host metric days, "
+                    f"{dropped_container} container metric days, {deleted_chunks} chunks"
+                )
         except Exception as e:
             logger.error(f"Error cleaning up old data: {e}")
-            db.rollback()
     
-    def run_collection_loop(self):
-        """Main collection loop running in separate thread"""
-        logger.info(f"Starting metrics collection loop (interval: {settings.collection_interval}s)")
+    def storage_row(self, row):
+        """container_metrics row keyed by the container's dimension key instead of its id and name"""
+        stored = {key: value for key, value in row.items() if key not in ('container_id', 'container_name')}
+        stored['container_key'] = container_registry.key_for(row['container_id'], row['container_name'])
+        return stored
+    
+    def collect_tick(self):
+        """Collect one host and container sample and hand it to the batched writer"""
+        # Ticks are aligned to whole seconds, which is also the stored resolution
+        timestamp = datetime.utcnow().replace(microsecond=0)
         
-        # Initialize database
-        init_db()
+        host_metric = self.collect_host_metrics(timestamp)
+        container_rows = self.collect_container_metrics(timestamp)
+        if host_metric:
+            self.writer.add(host_metrics, [host_metric])
+        self.writer.add(container_metrics, [self.storage_row(row) for row in container_rows])
+        hot_cache.add_tick(timestamp, host_metric, container_rows)
         
-        while True:
-            try:
-                db = SessionLocal()
-                
-                # Collect metrics
-                self.collect_host_metrics(db)
-                self.collect_container_metrics(db)
-                
-                # Cleanup old data (every 100 iterations)
-                if int(time.time()) % (settings.collection_interval * 100) == 0:
-                    self.cleanup_old_data(db)
-                
-                db.close()
-                
-            except Exception as e:
-                logger.error(f"Error in collection loop: {e}")
-            
-            time.sleep(settings.collection_interval)
+        self.writer.maybe_flush()
+        
+        # Serialize once per tick, however many dashboards are listening
+        if metrics_hub.has_subscribers:
+            metrics_hub.publish(json.dumps({
+                'type': 'tick',
+                'timestamp': timestamp,
+                'host_metrics': [host_metric] if host_metric else [],
+                'container_metrics': container_rows
+            }, default=lambda value: value.isoformat()))
+    
+    def run_retention(self):
+        """Retention job, scheduled independently of collection"""
+        self.cleanup_old_data()
+        self.rollups.cleanup()
+        if settings.raw_storage == "chunks":
+            self.compactor.run()
+
+scheduler = Scheduler()
 
 def start_collector():
-    """Start the metrics collector in a background thread"""
+    """Start the metrics collection and retention jobs in background threads"""
+    init_db()
     collector = MetricsCollector()
-    thread = threading.Thread(target=collector.run_collection_loop, daemon=True)
-    thread.start()
-    logger.info("Metrics collector thread started")
+    with engine.connect() as conn:
+        hot_cache.warm(conn)
+    
+    scheduler.add_job("collection", settings.collection_interval, collector.collect_tick)
+    scheduler.add_job("rollup", settings.rollup_interval, collector.rollups.run)
+    scheduler.add_job("retention", settings.retention_interval, collector.run_retention)
+    scheduler.add_job("sizes", settings.size_scan_interval, collector.sizes.run)
+    scheduler.add_job("log-index", settings.log_index_refresh_interval, log_indexes.run)
+    if settings.log_search_enabled:
+        scheduler.add_job("log-search", settings.log_search_interval, log_search.run)
+    scheduler.start()
+    if not collector.sizes.has_results():
+        # Fresh database: don't leave /api/containers/stats empty until the first aligned tick
+        threading.Thread(target=collector.sizes.run, name="container-size-initial", daemon=True).start()
+    logger.info(f"Metrics collector started (interval: {settings.collection_interval}s, retention check: {settings.retention_interval}s)")
+    return collector
+
+def stop_collector(collector):
+    """Stop the background jobs and write out any buffered rows"""
+    scheduler.stop()
+    collector.sizes.stop()
+    collector.writer.flush()
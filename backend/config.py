@@ -5,8 +5,40 @@ class Settings(BaseSettings):
     backend_host: str = "0.0.0.0"
     backend_port: int = 8000
     database_url: str = "sqlite:///./docker_metrics.db"
+    storage_profile: str = "tuned"  # default | tuned (SQLite WAL, split reader/writer pools)
+    sqlite_mmap_size: int = 268435456
+    sqlite_cache_size_kb: int = 65536
+    sqlite_read_pool_size: int = 8
     collection_interval: int = 30
     data_retention_days: int = 30
+    retention_interval: int = 3600
+    rollup_interval: int = 60
+    rollup_1m_retention_days: int = 14
+    rollup_5m_retention_days: int = 90
+    rollup_1h_retention_days: int = 365
+    raw_storage: str = "chunks"  # rows | chunks (compress raw days older than chunk_after_days)
+    chunk_after_days: int = 1
+    write_flush_size: int = 1000
+    write_flush_latency: float = 0.0
+    write_buffer_max_rows: int = 100000  # rows kept for retry while writes fail; the oldest are dropped beyond this
+    ws_queue_size: int = 16
+    hot_cache_size: int = 2880  # samples kept in memory per series (24h at 30s)
+    collection_mode: str = "concurrent"  # sequential | concurrent | streaming
+    collector_max_workers: int = 16
+    container_stats_timeout: float = 10.0
+    size_scan_interval: int = 1800
+    size_scan_concurrency: int = 2
+    size_scan_max_cpu: float = 80.0  # skip a size scan while host CPU is above this percentage
+    log_index_dir: str = "./log_index"  # sidecar indexes of container log files (never under /var/lib/docker)
+    log_index_interval: int = 1000  # lines between index checkpoints
+    log_index_refresh_interval: int = 30  # seconds between background index refreshes
+    log_follow_backlog: int = 50  # recent lines a new live log viewer starts with
+    log_level_rules: str = ""  # JSON file of [level, severity, keywords] rules replacing the built-in ones
+    log_search_enabled: bool = False  # full-text index of container logs for /api/logs/search
+    log_search_db: str = "./log_index/search.db"
+    log_search_interval: int = 60  # seconds between indexing passes
+    docker_api_workers: int = 8  # threads (and pooled connections) for Docker calls made by API requests
+    docker_api_timeout: float = 30.0
     cors_origins: str = "http://localhost:5173,http://localhost:3000"
     
     @property
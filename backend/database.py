@@ -1,12 +1,40 @@
-from sqlalchemy import create_engine, Column, Integer, Float, String, DateTime
+from sqlalchemy import (
+    create_engine, event, inspect, text, select, insert, update, func, MetaData,
+    Table, Column, Index, Integer, Float, String, DateTime, JSON, LargeBinary
+)
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
-from datetime import datetime
+from sqlalchemy.types import TypeDecorator
+from datetime import datetime, timedelta, timezone
 from config import settings
+from partitions import PartitionedTable
+import calendar
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
 
 Base = declarative_base()
+# Column templates for the per-day metric partitions; never created as tables themselves
+PartitionTemplate = declarative_base()
+
+class EpochDateTime(TypeDecorator):
+    """Naive UTC datetime stored as integer epoch seconds"""
+    impl = Integer
+    cache_ok = True
+    
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, int):
+            return value
+        return calendar.timegm(value.utctimetuple()) if value.tzinfo else calendar.timegm(value.timetuple())
+    
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return datetime.fromtimestamp(value, timezone.utc).replace(tzinfo=None)
 
-class HostMetric(Base):
+class HostMetric(PartitionTemplate):
     __tablename__ = "host_metrics"
     
     id = Column(Integer, primary_key=True, index=True)
@@ -19,36 +47,311 @@ class HostMetric(Base):
     disk_write_mb = Column(Float, default=0.0)
     network_in_mbit = Column(Float, default=0.0)
     network_out_mbit = Column(Float, default=0.0)
+    cpu_per_core = Column(JSON)
+    load_avg_1m = Column(Float)
+    load_avg_5m = Column(Float)
+    load_avg_15m = Column(Float)
 
-class ContainerMetric(Base):
-    __tablename__ = "container_metrics"
+class Container(Base):
+    """Containers dimension: metric rows reference a container by its small integer key"""
+    __tablename__ = "containers"
     
-    id = Column(Integer, primary_key=True, index=True)
-    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
-    container_id = Column(String, index=True)
+    id = Column(Integer, primary_key=True)
+    container_id = Column(String, unique=True, nullable=False)
     container_name = Column(String)
+
+class ContainerMetric(PartitionTemplate):
+    # Clustered on (container_key, timestamp), so per-container range reads are index-only
+    __tablename__ = "container_metrics"
+    __table_args__ = (
+        Index("ix_container_metrics_timestamp", "timestamp"),
+        {"sqlite_with_rowid": False}
+    )
+    
+    container_key = Column(Integer, primary_key=True)  # containers.id
+    timestamp = Column(EpochDateTime, default=datetime.utcnow, primary_key=True)
     cpu_percent = Column(Float)
     memory_percent = Column(Float)
     memory_used_mb = Column(Float)
     memory_limit_mb = Column(Float)
-    disk_read_kb = Column(Float, default=0.0)
-    disk_write_mb = Column(Float, default=0.0)
-    network_in_mbit = Column(Float, default=0.0)
-    network_out_mbit = Column(Float, default=0.0)
 
-# Database setup
-engine = create_engine(
-    settings.database_url,
-    connect_args={"check_same_thread": False} if "sqlite" in settings.database_url else {}
+host_metrics = PartitionedTable("host_metrics", HostMetric.__table__)
+container_metrics = PartitionedTable("container_metrics", ContainerMetric.__table__)
+PARTITIONED_TABLES = [host_metrics, container_metrics]
+
+# Rollup tiers: min/avg/max/last per series per bucket, finest first
+ROLLUP_TIERS = [("1m", 60), ("5m", 300), ("1h", 3600)]
+HOST_ROLLUP_FIELDS = [
+    "cpu_percent", "memory_percent", "memory_used_mb", "memory_total_mb",
+    "disk_read_kb", "disk_write_mb", "network_in_mbit", "network_out_mbit",
+    "load_avg_1m", "load_avg_5m", "load_avg_15m"
+]
+CONTAINER_ROLLUP_FIELDS = ["cpu_percent", "memory_percent", "memory_used_mb", "memory_limit_mb"]
+
+def rollup_table(name, key_columns, fields, time_type=DateTime):
+    columns = list(key_columns) + [
+        Column("bucket", time_type, primary_key=True),
+        Column("sample_count", Integer, default=0)
+    ]
+    for field in fields:
+        for agg in ("min", "avg", "max", "last"):
+            columns.append(Column(f"{field}_{agg}", Float))
+    return Table(name, Base.metadata, *columns)
+
+host_rollups = {
+    tier: rollup_table(f"host_metrics_{tier}", [], HOST_ROLLUP_FIELDS)
+    for tier, _ in ROLLUP_TIERS
+}
+container_rollups = {
+    tier: rollup_table(
+        f"container_metrics_{tier}",
+        [Column("container_key", Integer, primary_key=True)],
+        CONTAINER_ROLLUP_FIELDS,
+        EpochDateTime
+    )
+    for tier, _ in ROLLUP_TIERS
+}
+
+# Last bucket boundary each tier has been rolled up to
+rollup_state = Table(
+    "rollup_state", Base.metadata,
+    Column("tier", String, primary_key=True),
+    Column("watermark", DateTime)
 )
 
+class ContainerSize(Base):
+    """Disk usage per container from the background size scanner"""
+    __tablename__ = "container_sizes"
+    
+    container_id = Column(String, primary_key=True)
+    container_name = Column(String)
+    status = Column(String)
+    size_rw = Column(Integer, default=0)
+    size_root_fs = Column(Integer, default=0)
+    computed_at = Column(DateTime, nullable=False)
+
+# Raw samples of past days, compressed per series into fixed time chunks (see chunks.py)
+metric_chunks = Table(
+    "metric_chunks", Base.metadata,
+    Column("kind", String, primary_key=True),
+    Column("series_key", Integer, primary_key=True),  # containers.id, 0 for the host
+    Column("start", EpochDateTime, primary_key=True),
+    Column("end", EpochDateTime, nullable=False),  # one past the last sample
+    Column("sample_count", Integer, nullable=False),
+    Column("fields", String, nullable=False),
+    Column("data", LargeBinary, nullable=False),
+    Index("ix_metric_chunks_kind_start", "kind", "start"),
+    sqlite_with_rowid=False
+)
+
+# Database setup
+is_sqlite = settings.database_url.startswith("sqlite")
+database_path = make_url(settings.database_url).database if is_sqlite else None
+tuned_sqlite = is_sqlite and settings.storage_profile == "tuned" and database_path not in (None, "", ":memory:")
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """Per-connection pragmas for the tuned SQLite profile"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA mmap_size={settings.sqlite_mmap_size}")
+    cursor.execute(f"PRAGMA cache_size=-{settings.sqlite_cache_size_kb}")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+
+if tuned_sqlite:
+    # One dedicated writer connection for the collector, retention and other background jobs
+    engine = create_engine(
+        settings.database_url,
+        connect_args={"check_same_thread": False},
+        pool_size=1,
+        max_overflow=0
+    )
+    # Read-only pool for API requests; under WAL readers never wait on the writer
+    read_engine = create_engine(
+        make_url(settings.database_url).set(
+            database=f"file:{database_path}",
+            query={"mode": "ro", "uri": "true"}
+        ),
+        connect_args={"check_same_thread": False},
+        pool_size=settings.sqlite_read_pool_size,
+        max_overflow=settings.sqlite_read_pool_size
+    )
+    event.listen(engine, "connect", apply_sqlite_pragmas)
+    event.listen(read_engine, "connect", apply_sqlite_pragmas)
+else:
+    engine = create_engine(
+        settings.database_url,
+        connect_args={"check_same_thread": False} if is_sqlite else {}
+    )
+    read_engine = engine
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+def configure_sqlite_file():
+    """Persistent file settings: WAL for the tuned profile, and incremental auto-vacuum so
+    pages freed by dropped partitions can be returned to the filesystem"""
+    if not is_sqlite or database_path in (None, "", ":memory:"):
+        return
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if tuned_sqlite:
+            conn.exec_driver_sql("PRAGMA journal_mode=WAL")
+        if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() != 2:
+            # Only takes effect on an existing file after a full VACUUM (one-off)
+            conn.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.exec_driver_sql("VACUUM")
+
+def release_free_pages():
+    """Return pages freed by dropped partitions to the filesystem"""
+    if is_sqlite:
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.exec_driver_sql("PRAGMA incremental_vacuum")
+
+def add_missing_columns():
+    """Add columns introduced after a table was first created"""
+    with engine.begin() as conn:
+        inspector = inspect(conn)
+        tables = list(Base.metadata.sorted_tables)
+        for partitioned in PARTITIONED_TABLES:
+            tables += [partitioned.table(day) for day in partitioned.days(conn)]
+        for table in tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+
+def migrate_container_schema():
+    """Move container tables from per-row container_id/container_name strings and text
+    timestamps to container keys and epoch seconds. Returns True if anything was migrated."""
+    if not is_sqlite:
+        return False
+    tables = [ContainerMetric.__table__] + list(container_rollups.values())
+    
+    with engine.begin() as conn:
+        inspector = inspect(conn)
+        legacy = [
+            table for table in tables
+            if inspector.has_table(table.name)
+            and "container_id" in {column["name"] for column in inspector.get_columns(table.name)}
+        ]
+        if not legacy:
+            return False
+        
+        Container.__table__.create(conn, checkfirst=True)
+        for table in legacy:
+            legacy_name = f"{table.name}_legacy"
+            for index in inspector.get_indexes(table.name):
+                conn.exec_driver_sql(f"DROP INDEX IF EXISTS {index['name']}")
+            conn.exec_driver_sql(f"ALTER TABLE {table.name} RENAME TO {legacy_name}")
+            
+            # Last name seen for each container id becomes its dimension row
+            conn.exec_driver_sql(
+                f"INSERT INTO containers (container_id, container_name) "
+                f"SELECT container_id, container_name FROM {legacy_name} "
+                f"WHERE rowid IN (SELECT MAX(rowid) FROM {legacy_name} GROUP BY container_id) "
+                f"AND container_id NOT IN (SELECT container_id FROM containers)"
+            )
+            
+            table.create(conn)
+            columns = [column.name for column in table.columns]
+            expressions = []
+            for name in columns:
+                if name == "container_key":
+                    expressions.append("c.id")
+                elif isinstance(table.c[name].type, EpochDateTime):
+                    expressions.append(f"CAST(strftime('%s', l.{name}) AS INTEGER)")
+                else:
+                    expressions.append(f"l.{name}")
+            conn.exec_driver_sql(
+                f"INSERT OR IGNORE INTO {table.name} ({', '.join(columns)}) "
+                f"SELECT {', '.join(expressions)} FROM {legacy_name} l "
+                f"JOIN containers c ON c.container_id = l.container_id"
+            )
+            conn.exec_driver_sql(f"DROP TABLE {legacy_name}")
+            logger.info(f"Migrated {table.name} to keyed schema")
+    
+    if is_sqlite:
+        # Give the space of the dropped tables back to the filesystem
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.exec_driver_sql("VACUUM")
+    return True
+
+class ContainerRegistry:
+    """Maps Docker container ids to their containers-table keys, cached in memory"""
+    
+    def __init__(self):
+        self.keys = {}  # container id -> (key, name)
+        self.lock = threading.Lock()
+    
+    def key_for(self, container_id, container_name):
+        cached = self.keys.get(container_id)
+        if cached and cached[1] == container_name:
+            return cached[0]
+        
+        table = Container.__table__
+        with self.lock, engine.begin() as conn:
+            key = conn.execute(select(table.c.id).where(table.c.container_id == container_id)).scalar()
+            if key is None:
+                key = conn.execute(
+                    insert(table).values(container_id=container_id, container_name=container_name)
+                ).inserted_primary_key[0]
+            else:
+                # Containers can be renamed; keep the latest name
+                conn.execute(update(table).where(table.c.id == key).values(container_name=container_name))
+            self.keys[container_id] = (key, container_name)
+            return key
+
+container_registry = ContainerRegistry()
+
+def migrate_to_partitions():
+    """Move rows of the unpartitioned host_metrics / container_metrics tables into day partitions"""
+    with engine.begin() as conn:
+        inspector = inspect(conn)
+        for partitioned in PARTITIONED_TABLES:
+            if not inspector.has_table(partitioned.name):
+                continue
+            legacy = Table(partitioned.name, MetaData(), autoload_with=conn)
+            shared = [c.name for c in partitioned.template.columns if c.name in legacy.c]
+            days = conn.execute(
+                select(func.distinct(func.date(legacy.c.timestamp, "unixepoch")))
+                if isinstance(partitioned.template.c.timestamp.type, EpochDateTime)
+                else select(func.distinct(func.date(legacy.c.timestamp)))
+            ).scalars().all()
+            
+            for day in days:
+                if day is None:
+                    continue
+                day = datetime.strptime(day, "%Y-%m-%d").date()
+                table = partitioned.table(day)
+                table.create(conn, checkfirst=True)
+                start = datetime.combine(day, datetime.min.time())
+                end = start + timedelta(days=1)
+                bounds = (calendar.timegm(start.timetuple()), calendar.timegm(end.timetuple())) \
+                    if isinstance(partitioned.template.c.timestamp.type, EpochDateTime) else (start, end)
+                conn.execute(
+                    insert(table).prefix_with("OR IGNORE", dialect="sqlite").from_select(
+                        shared,
+                        select(*[legacy.c[name] for name in shared]).where(
+                            legacy.c.timestamp >= bounds[0], legacy.c.timestamp < bounds[1]
+                        )
+                    )
+                )
+            
+            legacy.drop(conn)
+            logger.info(f"Moved {partitioned.name} into {len(days)} day partitions")
 
 def init_db():
+    configure_sqlite_file()
+    migrate_container_schema()
+    migrate_to_partitions()
     Base.metadata.create_all(bind=engine)
+    add_missing_columns()
 
 def get_db():
-    db = SessionLocal()
+    db = ReadSessionLocal()
     try:
         yield db
     finally:
@@ -0,0 +1,46 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from config import settings
+import docker
+import asyncio
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+class DockerAPI:
+    """One connection-pooled Docker client for the API, with its blocking calls run on a bounded pool.
+    
+    Handlers await run() instead of calling the Docker SDK on the event loop, so a slow
+    daemon response only ties up one pool thread rather than every request in flight.
+    """
+    
+    def __init__(self, max_workers, timeout):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.client = None
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="docker-api")
+        self.lock = threading.Lock()
+    
+    def get_client(self):
+        """Shared client, created on first use; raises if the daemon is unreachable"""
+        with self.lock:
+            if self.client is None:
+                # One pooled connection per worker thread
+                self.client = docker.from_env(timeout=self.timeout, max_pool_size=self.max_workers)
+                logger.info("Docker API client initialized")
+            return self.client
+    
+    async def run(self, func, *args, **kwargs):
+        """Run a blocking function on the Docker pool and await its result"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(func, *args, **kwargs))
+    
+    def close(self):
+        self.executor.shutdown(wait=False)
+        with self.lock:
+            if self.client is not None:
+                self.client.close()
+                self.client = None
+
+docker_api = DockerAPI(settings.docker_api_workers, settings.docker_api_timeout)
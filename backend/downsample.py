@@ -0,0 +1,65 @@
+from datetime import datetime
+
+# LTTB keeps the first and last row plus at least one bucket between them
+MIN_POINTS = 3
+
+def lttb(rows, threshold, value=lambda row: row["cpu_percent"], timestamp=lambda row: row["timestamp"]):
+    """Largest-Triangle-Three-Buckets: keep `threshold` rows that preserve the visual shape.
+    
+    Always keeps the first and last row. Rows must be in time order. A threshold of 0
+    or less keeps every row; smaller positive thresholds are raised to MIN_POINTS.
+    """
+    count = len(rows)
+    if threshold <= 0:
+        return list(rows)
+    threshold = max(threshold, MIN_POINTS)
+    if threshold >= count:
+        return list(rows)
+    
+    xs = [_seconds(timestamp(row)) for row in rows]
+    ys = [value(row) or 0.0 for row in rows]
+    
+    sampled = [rows[0]]
+    bucket_size = (count - 2) / (threshold - 2)
+    a = 0
+    
+    for i in range(threshold - 2):
+        # Average point of the next bucket is the third triangle vertex
+        next_start = int((i + 1) * bucket_size) + 1
+        next_end = min(int((i + 2) * bucket_size) + 1, count)
+        span = next_end - next_start
+        avg_x = sum(xs[next_start:next_end]) / span
+        avg_y = sum(ys[next_start:next_end]) / span
+        
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        ax, ay = xs[a], ys[a]
+        
+        best_area = -1.0
+        best = start
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > best_area:
+                best_area = area
+                best = j
+        
+        sampled.append(rows[best])
+        a = best
+    
+    sampled.append(rows[-1])
+    return sampled
+
+def downsample_by_series(rows, threshold, key):
+    """Apply LTTB separately to each series, keeping the result in time order"""
+    series = {}
+    for row in rows:
+        series.setdefault(row[key], []).append(row)
+    
+    result = []
+    for series_rows in series.values():
+        result.extend(lttb(series_rows, threshold))
+    result.sort(key=lambda row: row["timestamp"])
+    return result
+
+def _seconds(value):
+    return value.timestamp() if isinstance(value, datetime) else float(value)
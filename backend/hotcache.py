@@ -0,0 +1,184 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import select
+from database import host_metrics, container_metrics, Container, HOST_ROLLUP_FIELDS, CONTAINER_ROLLUP_FIELDS
+from config import settings
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+def to_epoch(value):
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+def from_epoch(value):
+    return datetime.utcfromtimestamp(value)
+
+class RingBuffer:
+    """Fixed-capacity ring of samples for one series.
+    
+    Timestamps and numeric fields live in preallocated float arrays; a few
+    non-numeric fields (names, per-core lists) are kept in a parallel list.
+    """
+    
+    def __init__(self, capacity, fields, extra_fields=()):
+        self.capacity = capacity
+        self.fields = fields
+        self.extra_fields = extra_fields
+        self.timestamps = array('d', [0.0]) * capacity
+        self.columns = {field: array('d', [0.0]) * capacity for field in fields}
+        self.missing = {field: bytearray(capacity) for field in fields}
+        self.extras = [None] * capacity
+        self.head = 0  # slot the next sample is written to
+        self.size = 0
+    
+    def append(self, timestamp, row):
+        slot = self.head
+        self.timestamps[slot] = timestamp
+        for field in self.fields:
+            value = row.get(field)
+            self.missing[field][slot] = value is None
+            self.columns[field][slot] = value if value is not None else 0.0
+        self.extras[slot] = {field: row.get(field) for field in self.extra_fields}
+        self.head = (slot + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+    
+    def _slot(self, index):
+        """Physical slot of the index-th oldest sample"""
+        return (self.head - self.size + index) % self.capacity
+    
+    def _timestamp(self, index):
+        return self.timestamps[self._slot(index)]
+    
+    def _row(self, index):
+        slot = self._slot(index)
+        row = {'timestamp': from_epoch(self.timestamps[slot])}
+        for field in self.fields:
+            row[field] = None if self.missing[field][slot] else self.columns[field][slot]
+        row.update(self.extras[slot])
+        return row
+    
+    @property
+    def oldest(self):
+        return self._timestamp(0) if self.size else None
+    
+    @property
+    def newest(self):
+        return self._timestamp(self.size - 1) if self.size else None
+    
+    def latest(self):
+        return self._row(self.size - 1) if self.size else None
+    
+    def range(self, start, end, inclusive_start=True):
+        """Rows with start <= timestamp < end (start exclusive when inclusive_start is False)"""
+        view = _TimestampView(self)
+        lo = bisect_left(view, start) if inclusive_start else bisect_right(view, start)
+        hi = bisect_left(view, end)
+        return [self._row(i) for i in range(lo, hi)]
+
+class _TimestampView:
+    """Sequence view over a ring's timestamps in logical order, for bisect"""
+    
+    def __init__(self, ring):
+        self.ring = ring
+    
+    def __len__(self):
+        return self.ring.size
+    
+    def __getitem__(self, index):
+        return self.ring._timestamp(index)
+
+class HotCache:
+    """Last N samples for the host and each container, filled by the collector every tick"""
+    
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.host = RingBuffer(capacity, HOST_ROLLUP_FIELDS, ('cpu_per_core',))
+        self.containers = {}  # container id -> RingBuffer
+        self.newest_tick = None  # timestamp of the newest tick added, flushed to the database or not
+        self.lock = threading.Lock()
+    
+    def _container_ring(self, container_id):
+        ring = self.containers.get(container_id)
+        if ring is None:
+            ring = self.containers[container_id] = RingBuffer(
+                self.capacity, CONTAINER_ROLLUP_FIELDS, ('container_id', 'container_name')
+            )
+        return ring
+    
+    def add_tick(self, timestamp, host_row, container_rows):
+        epoch = to_epoch(timestamp)
+        with self.lock:
+            if self.newest_tick is None or timestamp > self.newest_tick:
+                self.newest_tick = timestamp
+            if host_row:
+                self.host.append(epoch, host_row)
+            for row in container_rows:
+                self._container_ring(row['container_id']).append(epoch, row)
+            
+            # Forget containers that have not reported for a full buffer's worth of time
+            horizon = epoch - self.capacity * settings.collection_interval
+            for container_id in [cid for cid, ring in self.containers.items() if ring.newest < horizon]:
+                del self.containers[container_id]
+    
+    def warm(self, conn):
+        """Preload the buffers from the database after a restart"""
+        since = datetime.utcnow() - timedelta(seconds=self.capacity * settings.collection_interval)
+        containers = Container.__table__
+        count = 0
+        with self.lock:
+            for host_table in host_metrics.tables_between(conn, since, None):
+                host_rows = conn.execute(
+                    select(host_table).where(host_table.c.timestamp >= since).order_by(host_table.c.timestamp)
+                )
+                for row in host_rows:
+                    row = row._mapping
+                    self.host.append(to_epoch(row['timestamp']), row)
+                    count += 1
+            for container_table in container_metrics.tables_between(conn, since, None):
+                container_rows = conn.execute(
+                    select(container_table, containers.c.container_id, containers.c.container_name)
+                    .join(containers, containers.c.id == container_table.c.container_key)
+                    .where(container_table.c.timestamp >= since)
+                    .order_by(container_table.c.timestamp)
+                )
+                for row in container_rows:
+                    row = row._mapping
+                    self._container_ring(row['container_id']).append(to_epoch(row['timestamp']), row)
+                    count += 1
+        logger.info(f"Hot cache warmed with {count} samples")
+    
+    def covers(self, start):
+        """Whether every sample at or after start is still held in memory"""
+        with self.lock:
+            oldest = self.host.oldest
+            return oldest is not None and to_epoch(start) >= oldest
+    
+    def latest(self):
+        """Latest host sample and the latest sample of every container still reporting"""
+        with self.lock:
+            host = self.host.latest()
+            newest = max((ring.newest for ring in self.containers.values()), default=None)
+            if newest is None:
+                return host, []
+            fresh_after = newest - 2 * settings.collection_interval
+            containers = [ring.latest() for ring in self.containers.values() if ring.newest >= fresh_after]
+        containers.sort(key=lambda row: row['container_name'] or '')
+        return host, containers
+    
+    def host_rows(self, start, end, inclusive_start=True):
+        with self.lock:
+            return self.host.range(to_epoch(start), to_epoch(end), inclusive_start)
+    
+    def container_rows(self, start, end, container_ids=None, inclusive_start=True):
+        with self.lock:
+            rows = []
+            for container_id, ring in self.containers.items():
+                if container_ids and container_id not in container_ids:
+                    continue
+                rows.extend(ring.range(to_epoch(start), to_epoch(end), inclusive_start))
+        rows.sort(key=lambda row: row['timestamp'])
+        return rows
+
+hot_cache = HotCache(settings.hot_cache_size)
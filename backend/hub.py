@@ -0,0 +1,59 @@
+from config import settings
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+class BroadcastHub:
+    """Fans messages published from any thread out to asyncio subscribers.
+    
+    Each subscriber gets a bounded queue; when a slow consumer's queue is full the
+    oldest message is dropped so one stalled client never holds up the others.
+    """
+    
+    def __init__(self, queue_size):
+        self.queue_size = queue_size
+        self.loop = None
+        self.subscribers = set()
+        self.dropped = 0
+    
+    def bind_loop(self, loop):
+        self.loop = loop
+    
+    @property
+    def has_subscribers(self):
+        return bool(self.subscribers)
+    
+    def subscribe(self):
+        """Register a subscriber; must be called on the event loop"""
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers.add(queue)
+        return queue
+    
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+    
+    def publish(self, message):
+        """Thread-safe: schedule delivery of an already serialized message"""
+        if self.loop is None or not self.subscribers:
+            return
+        try:
+            self.loop.call_soon_threadsafe(self._fan_out, message)
+        except RuntimeError:
+            # Event loop already closed during shutdown
+            pass
+    
+    def _fan_out(self, message):
+        for queue in list(self.subscribers):
+            if queue.full():
+                queue.get_nowait()
+                self.dropped += 1
+            queue.put_nowait(message)
+    
+    def stats(self):
+        return {
+            'subscribers': len(self.subscribers),
+            'dropped_messages': self.dropped
+        }
+
+metrics_hub = BroadcastHub(settings.ws_queue_size)
@@ -0,0 +1,126 @@
+import docker
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Container event actions that change what /api/containers/all shows
+CONTAINER_ACTIONS = {
+    "create", "start", "restart", "stop", "die", "kill", "pause", "unpause", "rename", "update", "destroy"
+}
+
+class ContainerInventory:
+    """Every container's inspect data held in memory and kept current from the Docker events stream.
+    
+    The full list is loaded once; after that only containers named in start/stop/die/
+    create/destroy/rename... events are re-inspected. Image tags are resolved once per
+    image and memoized until an image event invalidates them.
+    """
+    
+    def __init__(self, retry_delay=5):
+        self.retry_delay = retry_delay
+        self.containers = {}  # container id -> (attrs, image display name)
+        self.images = {}  # image id -> display name
+        self.ready = False
+        self.client = None
+        self.events = None
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+    
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="container-inventory", daemon=True)
+        self.thread.start()
+    
+    def stop(self):
+        self.stop_event.set()
+        if self.events is not None:
+            self.events.close()
+    
+    def snapshot(self):
+        """(attrs, image) for every container, newest first"""
+        with self.lock:
+            entries = list(self.containers.values())
+        entries.sort(key=lambda entry: entry[0].get('Created', ''), reverse=True)
+        return entries
+    
+    def _run(self):
+        while not self.stop_event.is_set():
+            try:
+                if self.client is None:
+                    self.client = docker.from_env()
+                # Events are replayed from before the load, so nothing between the two is missed
+                since = int(time.time())
+                self._load()
+                self.events = self.client.events(
+                    since=since, decode=True, filters={"type": ["container", "image"]}
+                )
+                for event in self.events:
+                    self._apply(event)
+            except Exception as e:
+                if not self.stop_event.is_set():
+                    logger.warning(f"Container inventory stream ended: {e}")
+            self.ready = False
+            self.stop_event.wait(self.retry_delay)
+    
+    def _load(self):
+        started = time.time()
+        with self.lock:
+            self.images.clear()
+        entries = {}
+        for container in self.client.containers.list(all=True):
+            entries[container.id] = (container.attrs, self._image_name(container.attrs))
+        with self.lock:
+            self.containers = entries
+        self.ready = True
+        logger.info(f"Container inventory loaded {len(entries)} containers in {time.time() - started:.2f}s")
+    
+    def _apply(self, event):
+        action = (event.get('Action') or '').split(':')[0]
+        if event.get('Type') == 'image':
+            # Tags moved or an image went away; re-resolve the names we show
+            with self.lock:
+                self.images.clear()
+                entries = list(self.containers.items())
+            refreshed = {cid: (attrs, self._image_name(attrs)) for cid, (attrs, _) in entries}
+            with self.lock:
+                for cid, entry in refreshed.items():
+                    if cid in self.containers:
+                        self.containers[cid] = entry
+            return
+        
+        if event.get('Type') != 'container' or action not in CONTAINER_ACTIONS:
+            return
+        container_id = event.get('id') or event.get('Actor', {}).get('ID')
+        if action == 'destroy':
+            with self.lock:
+                self.containers.pop(container_id, None)
+            return
+        try:
+            attrs = self.client.api.inspect_container(container_id)
+        except docker.errors.NotFound:
+            with self.lock:
+                self.containers.pop(container_id, None)
+            return
+        entry = (attrs, self._image_name(attrs))
+        with self.lock:
+            self.containers[container_id] = entry
+    
+    def _image_name(self, attrs):
+        """First tag of the container's image (memoized), else its short id"""
+        image_id = attrs.get('Image', '')
+        with self.lock:
+            name = self.images.get(image_id)
+        if name is not None:
+            return name
+        try:
+            tags = self.client.api.inspect_image(image_id).get('RepoTags') or []
+            name = tags[0] if tags else image_id[:12]
+        except docker.errors.NotFound:
+            name = attrs.get('Config', {}).get('Image') or image_id[:12]
+        with self.lock:
+            self.images[image_id] = name
+        return name
+
+container_inventory = ContainerInventory()
@@ -0,0 +1,118 @@
+from typing import NamedTuple, Optional, Tuple
+from config import settings
+import json
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+WORD = re.compile(r'\w+')
+
+class Rule(NamedTuple):
+    level: str
+    severity: Optional[str]
+    keywords: Tuple[str, ...]  # whole words, case-insensitive
+
+# Highest priority first: a line takes the level of the first rule any of its words matches
+DEFAULT_RULES = [
+    Rule('ERROR', 'high', ('error', '500')),
+    Rule('ERROR', None, ('502', '503', '504', 'failed', 'exception', 'fatal', 'critical')),
+    Rule('WARNING', 'medium', ('warn', 'warning', 'deprecated', 'caution')),
+    Rule('DEBUG', None, ('debug', 'trace', 'verbose')),
+    Rule('INFO', 'low', ('success', 'started', 'connected', 'ready')),
+]
+
+def load_rules(path):
+    """Rules from a JSON file of [level, severity, keywords] entries, highest priority first"""
+    with open(path) as f:
+        return [
+            Rule(level.upper(), severity, tuple(keywords.split() if isinstance(keywords, str) else keywords))
+            for level, severity, keywords in json.load(f)
+        ]
+
+class LogClassifier:
+    """Log level rules compiled into one keyword table, so a line is classified in a single pass.
+    
+    A line is split into words once and the words are looked up in a set of every
+    rule's keywords; the line takes the level of the highest-priority rule that hit.
+    This replaces running a separate IGNORECASE regex per level on every line.
+    """
+    
+    def __init__(self, rules=DEFAULT_RULES, default_level='INFO'):
+        self.rules = list(rules)
+        self.default_level = default_level
+        self.priority = {}
+        for index, rule in enumerate(self.rules):
+            for keyword in rule.keywords:
+                self.priority.setdefault(keyword.lower(), index)
+        self.keywords = frozenset(self.priority)
+    
+    def rule_index(self, message):
+        """Index of the highest-priority rule matching message, or None"""
+        hits = self.keywords.intersection(WORD.findall(message.lower()))
+        if not hits:
+            return None
+        return min(map(self.priority.__getitem__, hits))
+    
+    def level(self, message):
+        index = self.rule_index(message)
+        return self.rules[index].level if index is not None else self.default_level
+    
+    def classify(self, message):
+        """(level, details) of a message; details is None when no rule adds any"""
+        return self.describe(message, self.rule_index(message))
+    
+    def describe(self, message, index):
+        if index is None:
+            return self.default_level, None
+        rule = self.rules[index]
+        if not rule.severity:
+            return rule.level, None
+        details = {'severity': rule.severity}
+        if rule.level == 'ERROR' and rule.severity == 'high' and 'http' in message.lower():
+            details['type'] = 'HTTP Error'
+        return rule.level, details
+    
+    def rule_indexes(self, messages):
+        """rule_index of every message"""
+        findall = WORD.findall
+        intersection = self.keywords.intersection
+        priority = self.priority.__getitem__
+        indexes = []
+        for message in messages:
+            hits = intersection(findall(message.lower()))
+            indexes.append(min(map(priority, hits)) if hits else None)
+        return indexes
+    
+    def levels(self, messages):
+        """level() of every message"""
+        rules = self.rules
+        default_level = self.default_level
+        return [rules[index].level if index is not None else default_level for index in self.rule_indexes(messages)]
+    
+    def classify_batch(self, messages):
+        """classify() of every message"""
+        return [self.describe(message, index) for message, index in zip(messages, self.rule_indexes(messages))]
+
+def classify_entries(entries):
+    """Log entries for (timestamp, message) pairs, with levels assigned in one batch"""
+    classified = classifier.classify_batch([message for _, message in entries])
+    return [
+        {
+            'timestamp': timestamp,
+            'level': level,
+            'message': message,
+            'details': details
+        }
+        for (timestamp, message), (level, details) in zip(entries, classified)
+    ]
+
+def create_classifier():
+    if settings.log_level_rules:
+        try:
+            return LogClassifier(load_rules(settings.log_level_rules))
+        except Exception as e:
+            logger.error(f"Could not load log level rules from {settings.log_level_rules}, using the defaults: {e}")
+    return LogClassifier()
+
+classifier = create_classifier()
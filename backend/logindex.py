@@ -0,0 +1,269 @@
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+from config import settings
+from inventory import container_inventory
+import glob
+import hashlib
+import json
+import os
+import struct
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"DMLI1"
+HEADER = struct.Struct("<5sQQQQQ")  # magic, device, inode, interval, indexed bytes, line count
+ENTRY = struct.Struct("<qd")  # byte offset, epoch seconds
+
+def parse_rfc3339(value):
+    """Naive UTC datetime of a Docker RFC 3339 timestamp (nanoseconds are truncated)"""
+    if value[-1:] == 'Z' and value[10:11] == 'T':
+        # Docker's own fixed format (UTC, up to 9 fractional digits): cut the fraction
+        # to microseconds and let the C fromisoformat do the rest
+        try:
+            return datetime.fromisoformat(value[:26] if len(value) > 27 else value[:-1])
+        except ValueError:
+            pass
+    value = value.strip()
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    dot = value.find('.')
+    if dot != -1:
+        # fromisoformat takes at most 6 fractional digits
+        end = dot + 1
+        while end < len(value) and value[end].isdigit():
+            end += 1
+        value = value[:dot + 7 if end > dot + 7 else end] + value[end:]
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def to_epoch(value):
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+def line_time(line):
+    """Epoch seconds of a json-file log line, or None"""
+    try:
+        return to_epoch(parse_rfc3339(json.loads(line)['time']))
+    except Exception:
+        return None
+
+def rotated_files(path):
+    """Older files Docker's json-file driver rotated out of a log (<path>.1, <path>.2.gz, ...)"""
+    return glob.glob(f"{glob.escape(path)}.*")
+
+class LogIndex:
+    """Sidecar index of one Docker json-file log: the byte offset and timestamp of every
+    interval-th line, kept in the local index directory (never next to the log).
+    
+    refresh() extends it over lines appended since the last call and starts over when
+    the file was rotated (new inode) or truncated. New checkpoints are appended to the
+    sidecar file; it is only rewritten when the index starts over.
+    """
+    
+    def __init__(self, path, index_path, interval):
+        self.path = path
+        self.index_path = index_path
+        self.interval = interval
+        self.identity = None
+        self.indexed_bytes = 0
+        self.line_count = 0
+        self.offsets = []
+        self.times = []
+        self.saved_entries = None  # checkpoints already in the sidecar file
+        self.lock = threading.Lock()
+        self._load()
+    
+    def _load(self):
+        try:
+            with open(self.index_path, 'rb') as f:
+                magic, device, inode, interval, indexed_bytes, line_count = HEADER.unpack(f.read(HEADER.size))
+                if magic != MAGIC or interval != self.interval:
+                    return
+                data = f.read()
+            entries = [ENTRY.unpack_from(data, i) for i in range(0, len(data) - len(data) % ENTRY.size, ENTRY.size)]
+        except (OSError, struct.error):
+            return
+        # The header is written after the entries it counts, so extra entries are from an interrupted append
+        expected = (line_count + interval - 1) // interval
+        if len(entries) < expected:
+            return
+        entries = entries[:expected]
+        self.identity = (device, inode)
+        self.indexed_bytes = indexed_bytes
+        self.line_count = line_count
+        self.offsets = [offset for offset, _ in entries]
+        self.times = [timestamp for _, timestamp in entries]
+        self.saved_entries = expected
+    
+    def _save(self):
+        header = HEADER.pack(MAGIC, *self.identity, self.interval, self.indexed_bytes, self.line_count)
+        saved = self.saved_entries
+        entries = b"".join(
+            ENTRY.pack(offset, timestamp) for offset, timestamp in zip(self.offsets[saved or 0:], self.times[saved or 0:])
+        )
+        if saved is not None:
+            # Append the new checkpoints, then update the header that counts them
+            with open(self.index_path, 'r+b') as f:
+                f.seek(HEADER.size + saved * ENTRY.size)
+                f.write(entries)
+                f.seek(0)
+                f.write(header)
+        else:
+            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+            temp_path = f"{self.index_path}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(header)
+                f.write(entries)
+            os.replace(temp_path, self.index_path)
+        self.saved_entries = len(self.offsets)
+    
+    def refresh(self):
+        """Index complete lines appended since the last refresh"""
+        with self.lock:
+            with open(self.path, 'rb') as f:
+                stat = os.fstat(f.fileno())
+                identity = (stat.st_dev, stat.st_ino)
+                if identity != self.identity or stat.st_size < self.indexed_bytes:
+                    # Rotated or truncated: start over
+                    self.identity = identity
+                    self.indexed_bytes = 0
+                    self.line_count = 0
+                    self.offsets = []
+                    self.times = []
+                    self.saved_entries = None
+                if stat.st_size == self.indexed_bytes:
+                    return
+                
+                f.seek(self.indexed_bytes)
+                offset = self.indexed_bytes
+                last_time = self.times[-1] if self.times else 0.0
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        # Still being written; index it next time
+                        break
+                    if self.line_count % self.interval == 0:
+                        timestamp = line_time(line)
+                        last_time = timestamp if timestamp is not None else last_time
+                        self.offsets.append(offset)
+                        self.times.append(last_time)
+                    self.line_count += 1
+                    offset += len(line)
+                self.indexed_bytes = offset
+            try:
+                self._save()
+            except OSError as e:
+                self.saved_entries = None
+                logger.warning(f"Could not save log index for {self.path}: {e}")
+    
+    def line_offset(self, f, line):
+        """Byte offset of the given 0-based line, seeking to the nearest checkpoint first"""
+        line = max(0, min(line, self.line_count))
+        checkpoint = min(line // self.interval, len(self.offsets) - 1)
+        if checkpoint < 0:
+            return 0
+        f.seek(self.offsets[checkpoint])
+        offset = self.offsets[checkpoint]
+        for _ in range(line - checkpoint * self.interval):
+            offset += len(f.readline())
+        return offset
+    
+    def line_numbers(self, f, offsets):
+        """1-based line numbers of the lines starting at the given byte offsets (ascending)"""
+        checkpoint = bisect_right(self.offsets, offsets[0]) - 1 if offsets else -1
+        position, line = (self.offsets[checkpoint], checkpoint * self.interval) if checkpoint >= 0 else (0, 0)
+        numbers = []
+        for offset in offsets:
+            f.seek(position)
+            remaining = offset - position
+            while remaining > 0:
+                block = f.read(min(remaining, 1 << 20))
+                if not block:
+                    break
+                line += block.count(b'\n')
+                remaining -= len(block)
+            position = offset
+            numbers.append(line + 1)
+        return numbers
+    
+    def covers(self, when):
+        """Whether every line from `when` on is still in the current file, not a rotated one"""
+        if not self.times:
+            return False
+        return self.times[0] <= to_epoch(when) or not rotated_files(self.path)
+    
+    def offset_before(self, when):
+        """Offset of a checkpoint earlier than when; every line from `when` on is after it"""
+        position = bisect_left(self.times, to_epoch(when)) - 1
+        return self.offsets[position] if position >= 0 else 0
+    
+    def offset_after(self, when):
+        """Offset of the first checkpoint later than when, or None if there is none"""
+        position = bisect_right(self.times, to_epoch(when))
+        return self.offsets[position] if position < len(self.offsets) else None
+
+class LogIndexRegistry:
+    """One LogIndex per log path, stored under index_dir by a hash of the path.
+    
+    Indexes are built and extended by a scheduled job (run), never on the request path:
+    get() only hands out an index that already describes the current file.
+    """
+    
+    def __init__(self, index_dir, interval):
+        self.index_dir = index_dir
+        self.interval = interval
+        self.indexes = {}
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+    
+    def index_for(self, path):
+        with self.lock:
+            index = self.indexes.get(path)
+            if index is None:
+                name = hashlib.sha1(path.encode()).hexdigest()
+                index = self.indexes[path] = LogIndex(
+                    path, os.path.join(self.index_dir, f"{name}.idx"), self.interval
+                )
+            return index
+    
+    def get(self, path):
+        """Index of a log file, or None until the job has indexed the file as it is now"""
+        index = self.index_for(os.path.realpath(path))
+        try:
+            stat = os.stat(index.path)
+        except OSError:
+            return None
+        # A rotated file has a new inode; its index is rebuilt on the next run
+        return index if index.identity == (stat.st_dev, stat.st_ino) else None
+    
+    def run(self):
+        """Extend the index of every container's log file, and of any other log read since the last run"""
+        if not self.refresh_lock.acquire(blocking=False):
+            return
+        try:
+            started = time.time()
+            paths = set()
+            if container_inventory.ready:
+                for attrs, _ in container_inventory.snapshot():
+                    path = attrs.get('LogPath')
+                    if path and os.access(path, os.R_OK):
+                        paths.add(os.path.realpath(path))
+            with self.lock:
+                paths.update(self.indexes)
+            for path in paths:
+                if not os.path.exists(path):
+                    with self.lock:
+                        self.indexes.pop(path, None)
+                    continue
+                try:
+                    self.index_for(path).refresh()
+                except Exception as e:
+                    logger.warning(f"Error indexing log file {path}: {e}")
+            logger.debug(f"Refreshed {len(paths)} log indexes in {time.time() - started:.2f}s")
+        finally:
+            self.refresh_lock.release()
+
+log_indexes = LogIndexRegistry(settings.log_index_dir, settings.log_index_interval)
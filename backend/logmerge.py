@@ -0,0 +1,78 @@
+from logclassify import classifier
+from logindex import parse_rfc3339, to_epoch
+from logreader import read_log_window, split_timestamp, stream_lines
+import heapq
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Entries serialized per chunk of the streamed response
+BATCH_SIZE = 500
+
+def file_entries(path, start, end, index=None):
+    """(time, timestamp, message) of a json-file log's lines in [start, end), oldest first"""
+    for timestamp, message in read_log_window(path, start, end, index):
+        yield parse_rfc3339(timestamp), timestamp, message
+
+def docker_entries(container, start, end):
+    """(time, timestamp, message) of a container's lines in [start, end), streamed from the Docker API"""
+    stream = container.logs(
+        stream=True, timestamps=True, since=int(to_epoch(start)), until=int(to_epoch(end)) + 1
+    )
+    try:
+        for line in stream_lines(stream):
+            if not line.strip():
+                continue
+            timestamp, message = split_timestamp(line)
+            try:
+                line_time = parse_rfc3339(timestamp)
+            except ValueError:
+                continue
+            # Docker's since/until are whole seconds
+            if start <= line_time < end:
+                yield line_time, timestamp, message
+    finally:
+        stream.close()
+
+def tagged(container_name, entries):
+    for line_time, timestamp, message in entries:
+        yield line_time, container_name, timestamp, message
+
+def merge_logs(sources, level=None, search=None, limit=None):
+    """Yield the entries of several containers' logs as one time-ordered sequence.
+    
+    sources maps a container name to an iterator of its (time, timestamp, message) in
+    time order. heapq.merge holds one pending line per container, so memory does not
+    grow with the number of lines; filters are applied as lines come out of the merge.
+    """
+    level = level.upper() if level and level.upper() != 'ALL' else None
+    search = search.lower() if search else None
+    merged = heapq.merge(*(tagged(name, entries) for name, entries in sources.items()))
+    count = 0
+    for _, container_name, timestamp, message in merged:
+        if search and search not in message.lower():
+            continue
+        log_level = classifier.level(message)
+        if level and log_level != level:
+            continue
+        yield {
+            'timestamp': timestamp,
+            'container_name': container_name,
+            'level': log_level,
+            'message': message
+        }
+        count += 1
+        if limit and count >= limit:
+            break
+
+def ndjson(entries, batch_size=BATCH_SIZE):
+    """Newline-delimited JSON of entries, a batch of lines per chunk"""
+    batch = []
+    for entry in entries:
+        batch.append(json.dumps(entry))
+        if len(batch) >= batch_size:
+            yield '\n'.join(batch) + '\n'
+            batch = []
+    if batch:
+        yield '\n'.join(batch) + '\n'
@@ -0,0 +1,388 @@
+from datetime import datetime
+import base64
+import json
+import mmap
+import os
+from logindex import parse_rfc3339
+from logclassify import classifier
+import logging
+
+logger = logging.getLogger(__name__)
+
+BLOCK_SIZE = 65536
+SCAN_BLOCK_SIZE = 1 << 22
+
+# Characters Docker's json-file driver writes as-is; other characters may be escaped
+# (quotes, backslashes, control characters, and <, >, & as \u003c...)
+RAW_SEARCH_CHARACTERS = frozenset(chr(c) for c in range(0x20, 0x7f)) - set('"\\<>&')
+# A json-file line starts with the message; a match after it is in the metadata
+LOG_FIELD = b'{"log":"'
+STREAM_FIELD = b'","stream":"'
+
+class CursorError(ValueError):
+    """A page cursor that is malformed or belongs to a different (rotated) file"""
+
+def parse_log_line(line):
+    """(timestamp, message, stream) of one Docker json-file line"""
+    text = line.decode('utf-8', errors='ignore')
+    try:
+        # Try to parse as JSON (Docker log format)
+        log_entry = json.loads(text)
+        timestamp = log_entry.get('time', datetime.utcnow().isoformat())
+        message = log_entry.get('log', '').strip()
+        stream = log_entry.get('stream', 'stdout')
+    except json.JSONDecodeError:
+        # Fallback to plain text parsing
+        timestamp = datetime.utcnow().isoformat()
+        message = text.strip()
+        stream = 'stdout'
+    return timestamp, message, stream
+
+def split_timestamp(line):
+    """(timestamp, message) of a line from Docker's logs(timestamps=True)"""
+    parts = line.split(' ', 1)
+    if len(parts) == 2:
+        return parts[0], parts[1].strip()
+    return datetime.utcnow().isoformat(), line.strip()
+
+def stream_lines(chunks):
+    """Decoded lines of a streamed log body, reassembled across chunk boundaries"""
+    partial = b''
+    for chunk in chunks:
+        lines = (partial + chunk).split(b'\n')
+        partial = lines.pop()
+        for line in lines:
+            yield line.decode('utf-8', errors='ignore')
+    if partial:
+        yield partial.decode('utf-8', errors='ignore')
+
+def lines_forward(f, start):
+    """Yield (offset, line) for every line starting at or after start"""
+    f.seek(start)
+    offset = start
+    for line in f:
+        yield offset, line
+        offset += len(line)
+
+def lines_backward(f, end, block_size=BLOCK_SIZE):
+    """Yield (offset, line) for every line that starts before end, last line first.
+    
+    Reads fixed-size blocks from end towards the start of the file, so the memory
+    used is one block plus the longest line regardless of file size.
+    """
+    position = end
+    remainder = b''
+    while position > 0:
+        size = min(block_size, position)
+        position -= size
+        f.seek(position)
+        block = f.read(size) + remainder
+        parts = block.split(b'\n')
+        # The first part may continue in the previous block
+        remainder = parts[0]
+        offset = position + len(parts[0]) + 1
+        lines = []
+        for part in parts[1:]:
+            lines.append((offset, part + b'\n'))
+            offset += len(part) + 1
+        for offset, line in reversed(lines):
+            if line.strip():
+                yield offset, line
+    if remainder.strip():
+        yield 0, remainder
+
+class RawSearch:
+    """Case-insensitive substring search over the raw bytes of a memory-mapped log.
+    
+    The file is scanned in line-aligned blocks and only lines containing the text are
+    sliced out and decoded. Without letters in the text the scan is a plain find on
+    the mapping; otherwise each block is lower-cased first. Scanned blocks are dropped
+    from the process's resident set, so memory stays flat on multi-GB files.
+    """
+    
+    def __init__(self, search, block_size=SCAN_BLOCK_SIZE):
+        self.needle = search.lower().encode()
+        self.fold = self.needle.upper() != self.needle
+        self.block_size = block_size
+    
+    @classmethod
+    def create(cls, search):
+        """RawSearch for search, or None when the text may be escaped in the raw lines"""
+        if not search or not set(search) <= RAW_SEARCH_CHARACTERS:
+            return None
+        return cls(search)
+    
+    def block_lines(self, mm, low, high):
+        """(offset, line) of the lines in the line-aligned block [low, high) containing the text"""
+        if self.fold:
+            haystack, base = mm[low:high].lower(), low
+        else:
+            haystack, base = mm, 0
+        position, end = low - base, high - base
+        while position < end:
+            found = haystack.find(self.needle, position, end)
+            if found == -1:
+                break
+            newline = haystack.rfind(b'\n', position, found)
+            line_start = newline + 1 if newline != -1 else position
+            newline = haystack.find(b'\n', found + len(self.needle), end)
+            line_end = newline + 1 if newline != -1 else end
+            position = line_end
+            if haystack[line_start:line_start + len(LOG_FIELD)] == LOG_FIELD:
+                # The first hit is past the message (in the stream or time field)
+                stream_field = haystack.find(STREAM_FIELD, line_start, line_end)
+                if stream_field != -1 and found >= stream_field:
+                    continue
+            yield base + line_start, mm[base + line_start:base + line_end]
+        release(mm, low, high)
+    
+    def lines_forward(self, mm, start, end):
+        """Matching (offset, line) in [start, end), first line first; start is a line start"""
+        low = start
+        while low < end:
+            high = min(end, low + self.block_size)
+            if high < end:
+                # Finish the line the block boundary cuts
+                newline = mm.find(b'\n', high - 1, end)
+                high = newline + 1 if newline != -1 else end
+            yield from self.block_lines(mm, low, high)
+            low = high
+    
+    def lines_backward(self, mm, end, start=0):
+        """Matching (offset, line) in [start, end), last line first"""
+        high = end
+        while high > start:
+            low = max(start, high - self.block_size)
+            while low > start:
+                # Begin the block at a line start; the line cut by low belongs to the next block
+                newline = mm.find(b'\n', low - 1, high - 1)
+                if newline != -1:
+                    low = newline + 1
+                    break
+                low = max(start, low - self.block_size)
+            yield from reversed(list(self.block_lines(mm, low, high)))
+            high = low
+
+def release(mm, low, high):
+    """Drop a scanned range of a read-only mapping from memory (the page cache keeps it)"""
+    if hasattr(mmap, 'MADV_DONTNEED'):
+        start = low - low % mmap.PAGESIZE
+        mm.madvise(mmap.MADV_DONTNEED, start, high - start)
+
+def read_log_window(path, start, end, index=None):
+    """Yield (timestamp, message) of lines with start <= time < end, oldest first.
+    
+    With a LogIndex the read starts at the checkpoint just before start instead of
+    at the beginning of the file.
+    """
+    with open(path, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        low = 0
+        if index is not None and index.identity == (stat.st_dev, stat.st_ino):
+            low = index.offset_before(start)
+        for _, line in lines_forward(f, low):
+            if not line.strip():
+                continue
+            timestamp, message, _ = parse_log_line(line)
+            try:
+                line_time = parse_rfc3339(timestamp)
+            except ValueError:
+                continue
+            if line_time < start:
+                continue
+            if line_time >= end:
+                break
+            yield timestamp, message
+
+def encode_cursor(direction, offset, file_id):
+    raw = f"{direction}:{offset}:{file_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor, file_id):
+    """(direction, offset) of a cursor issued for this file"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        direction, offset, cursor_file = raw.split(':')
+        offset = int(offset)
+    except Exception:
+        raise CursorError('Invalid cursor')
+    if direction not in ('before', 'after') or offset < 0:
+        raise CursorError('Invalid cursor')
+    if cursor_file != file_id:
+        raise CursorError('Log file was rotated since this cursor was issued')
+    return direction, offset
+
+def file_identity(stat):
+    return f"{stat.st_dev}-{stat.st_ino}"
+
+def add_line_numbers(f, index, entries):
+    """Set line_number on entries that carry a byte offset; None without an index to count from"""
+    if index is None:
+        for entry in entries:
+            entry['line_number'] = None
+        return
+    offsets = sorted(entry['offset'] for entry in entries)
+    numbers = dict(zip(offsets, index.line_numbers(f, offsets)))
+    for entry in entries:
+        entry['line_number'] = numbers[entry['offset']]
+
+def read_log_page(
+    path, page_size, cursor=None, page=1, sort='newest', level=None, search=None,
+    container_name=None, start=None, end=None, index=None
+):
+    """One page of a Docker json-file log, read by seeking instead of loading the file.
+    
+    Lines are taken in file order (newest first for sort=newest, reading backwards from
+    the end) and only until the page is full. The next/previous cursors are byte offsets
+    into the file, so following pages resume where this one stopped. With a LogIndex,
+    the start/end time window and page N are found by binary search instead of a scan.
+    A search is first matched against the raw bytes (RawSearch), so only lines that
+    contain the text are decoded.
+    
+    Each entry keeps its byte offset and, with an index, its line_number. total and
+    total_pages are only known for an unfiltered read with an index and are None
+    otherwise; has_more always says whether another page follows.
+    """
+    level = level.upper() if level and level.upper() != 'ALL' else None
+    search = search.lower() if search else None
+    unfiltered = not (level or search or start or end)
+    
+    with open(path, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        file_id = file_identity(stat)
+        # Only lines that were complete when the request started
+        size = stat.st_size
+        if index is not None and index.identity != (stat.st_dev, stat.st_ino):
+            index = None
+        
+        # Byte range that can hold the time window
+        low, high = 0, size
+        if index is not None and start:
+            low = index.offset_before(start)
+        if index is not None and end:
+            high = min(index.offset_after(end) or size, size)
+        
+        newest_first = sort != 'oldest'
+        skip = 0
+        if cursor:
+            direction, offset = decode_cursor(cursor, file_id)
+            offset = min(offset, size)
+        elif index is not None and unfiltered and page > 1:
+            # Page N of an unfiltered file is a line number
+            lines_before = (page - 1) * page_size
+            if newest_first:
+                direction, offset = 'before', index.line_offset(f, index.line_count - lines_before)
+            else:
+                direction, offset = 'after', index.line_offset(f, lines_before)
+        else:
+            direction, offset = ('before', high) if newest_first else ('after', low)
+            skip = max(page - 1, 0) * page_size
+        
+        raw_search = RawSearch.create(search) if size else None
+        mapped = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) if raw_search else None
+        if mapped is not None:
+            # Search the raw bytes and decode only the lines that contain the text
+            if direction == 'before':
+                lines = raw_search.lines_backward(mapped, offset, low)
+            else:
+                lines = raw_search.lines_forward(mapped, offset, min(high, size))
+        elif direction == 'before':
+            lines = lines_backward(f, offset)
+        else:
+            lines = lines_forward(f, offset)
+        entries = []
+        for line_offset, line in lines:
+            if line_offset >= size or (direction == 'after' and line_offset >= high):
+                break
+            if direction == 'before' and line_offset < low:
+                break
+            if not line.strip():
+                continue
+            timestamp, message, stream = parse_log_line(line)
+            
+            if start or end:
+                try:
+                    line_time = parse_rfc3339(timestamp)
+                except ValueError:
+                    continue
+                # Lines are in time order, so leaving the window ends the page
+                if start and line_time < start:
+                    if direction == 'before':
+                        break
+                    continue
+                if end and line_time >= end:
+                    if direction == 'after':
+                        break
+                    continue
+            
+            # Apply search filter (a raw match may be in another field or an escape sequence)
+            if search and search not in message.lower():
+                continue
+            # Apply level filter
+            log_level = classifier.level(message) if level else None
+            if level and log_level != level:
+                continue
+            if skip:
+                skip -= 1
+                continue
+            
+            entries.append({
+                'offset': line_offset,
+                'end_offset': line_offset + len(line),
+                'timestamp': timestamp,
+                'level': log_level or classifier.level(message),
+                'message': message,
+                'stream': stream,
+                'container_name': container_name if container_name else 'Unknown',
+                'size': len(message)
+            })
+            # One extra line tells whether another page exists
+            if len(entries) > page_size:
+                break
+        if mapped is not None:
+            mapped.close()
+        
+        has_more = len(entries) > page_size
+        entries = entries[:page_size]
+        add_line_numbers(f, index, entries)
+    
+    # Pages are read away from the cursor; show them in the requested order
+    if (direction == 'before') != newest_first:
+        entries.reverse()
+    
+    next_cursor = prev_cursor = None
+    if entries:
+        first, last = entries[0], entries[-1]
+        forward_more = has_more if (direction == 'before') == newest_first else True
+        backward_more = has_more if (direction == 'before') != newest_first else True
+        if newest_first:
+            next_cursor = encode_cursor('before', last['offset'], file_id) if forward_more else None
+            prev_cursor = encode_cursor('after', first['end_offset'], file_id) if backward_more else None
+        else:
+            next_cursor = encode_cursor('after', last['end_offset'], file_id) if forward_more else None
+            prev_cursor = encode_cursor('before', first['offset'], file_id) if backward_more else None
+        if not cursor:
+            # First page (or page N) of the file: nothing before it
+            prev_cursor = prev_cursor if page > 1 else None
+    
+    logs = []
+    for entry in entries:
+        entry = dict(entry)
+        del entry['end_offset']
+        logs.append(entry)
+    
+    result = {
+        'logs': logs,
+        'page': page if not cursor else None,
+        'page_size': page_size,
+        'next_cursor': next_cursor,
+        'prev_cursor': prev_cursor,
+        'has_more': next_cursor is not None,
+        'container_name': container_name,
+        'total': None,
+        'total_pages': None
+    }
+    if index is not None and unfiltered:
+        result['total'] = index.line_count
+        result['total_pages'] = (index.line_count + page_size - 1) // page_size
+    return result
@@ -0,0 +1,348 @@
+from sqlalchemy import create_engine, event, text
+from config import settings
+from inventory import container_inventory
+from logreader import lines_forward, parse_log_line
+from logclassify import classifier
+from logindex import parse_rfc3339, to_epoch
+import os
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS log_files (
+        id INTEGER PRIMARY KEY,
+        path TEXT UNIQUE NOT NULL,
+        container_id TEXT,
+        container_name TEXT,
+        identity TEXT,
+        indexed_bytes INTEGER NOT NULL DEFAULT 0
+    )""",
+    """CREATE TABLE IF NOT EXISTS log_lines (
+        id INTEGER PRIMARY KEY,
+        file_id INTEGER NOT NULL,
+        offset INTEGER NOT NULL,
+        time REAL,
+        timestamp TEXT,
+        level TEXT,
+        stream TEXT
+    )""",
+    "CREATE INDEX IF NOT EXISTS ix_log_lines_file_time ON log_lines (file_id, time)",
+    "CREATE INDEX IF NOT EXISTS ix_log_lines_time ON log_lines (time)",
+    # Trigram tokens make any substring of 3+ characters an index lookup
+    "CREATE VIRTUAL TABLE IF NOT EXISTS log_messages USING fts5(message, tokenize='trigram')"
+]
+
+# Lines inserted per transaction while catching up on a file
+BATCH_SIZE = 5000
+
+def phrase(value):
+    """FTS5 phrase for value; the trigram tokenizer matches it as a case-insensitive substring"""
+    return '"' + value.replace('"', '""') + '"'
+
+def substring_condition(name, value, params):
+    """SQL for a case-insensitive match of a substring too short for trigrams (under 3 characters)"""
+    # LIKE on the FTS column mishandles such patterns in some SQLite releases, so compare outside it
+    params[name] = value.lower()
+    return f"instr(lower(m.message), :{name}) > 0"
+
+def line_matches(entry, substring, terms, level, start, end):
+    """Python twin of the SQL filters, for lines not indexed yet"""
+    message = entry['message'].lower()
+    if substring and substring.lower() not in message:
+        return False
+    if any(term.lower() not in message for term in terms):
+        return False
+    if level and entry['level'] != level:
+        return False
+    if (start or end) and entry['time'] is None:
+        return False
+    if start and entry['time'] < to_epoch(start):
+        return False
+    if end and entry['time'] >= to_epoch(end):
+        return False
+    return True
+
+class LogSearchIndex:
+    """Full-text index of container log messages in a separate SQLite database (FTS5, trigram).
+    
+    A scheduled job appends lines written since its last run to the index; a rotated or
+    truncated log file is dropped from the index and indexed again from its start.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.engine = None
+        self.lock = threading.Lock()
+    
+    def init(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        self.engine = create_engine(f"sqlite:///{self.path}", connect_args={"check_same_thread": False})
+        event.listen(self.engine, "connect", lambda dbapi_connection, record: dbapi_connection.execute("PRAGMA busy_timeout=5000"))
+        with self.engine.begin() as conn:
+            conn.exec_driver_sql("PRAGMA journal_mode=WAL")
+            for statement in SCHEMA:
+                conn.exec_driver_sql(statement)
+    
+    def run(self):
+        """Index what was appended to every container's log since the last run"""
+        if not container_inventory.ready:
+            return
+        if self.engine is None:
+            self.init()
+        started = time.time()
+        indexed = 0
+        with self.lock:
+            paths = set()
+            for attrs, _ in container_inventory.snapshot():
+                path = attrs.get('LogPath')
+                if not path or not os.access(path, os.R_OK):
+                    continue
+                paths.add(path)
+                try:
+                    indexed += self.index_file(path, attrs['Id'], attrs['Name'].lstrip('/'))
+                except Exception as e:
+                    logger.warning(f"Error indexing log file {path}: {e}")
+            self.forget_missing(paths)
+        if indexed:
+            logger.info(f"Indexed {indexed} log lines for search in {time.time() - started:.2f}s")
+    
+    def index_file(self, path, container_id, container_name):
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            identity = f"{stat.st_dev}-{stat.st_ino}"
+            with self.engine.begin() as conn:
+                row = conn.execute(
+                    text("SELECT id, identity, indexed_bytes FROM log_files WHERE path = :path"), {"path": path}
+                ).first()
+                if row is None:
+                    file_id = conn.execute(
+                        text(
+                            "INSERT INTO log_files (path, container_id, container_name, identity, indexed_bytes) "
+                            "VALUES (:path, :container_id, :container_name, :identity, 0)"
+                        ),
+                        {"path": path, "container_id": container_id, "container_name": container_name, "identity": identity}
+                    ).lastrowid
+                    offset = 0
+                else:
+                    file_id, offset = row.id, row.indexed_bytes
+                    if row.identity != identity or stat.st_size < offset:
+                        # Rotated or truncated: index the new file from the start
+                        self.clear_file(conn, file_id)
+                        offset = 0
+                    conn.execute(
+                        text("UPDATE log_files SET identity = :identity, container_name = :name, indexed_bytes = :offset WHERE id = :id"),
+                        {"identity": identity, "name": container_name, "offset": offset, "id": file_id}
+                    )
+            if stat.st_size == offset:
+                return 0
+            
+            indexed = 0
+            batch = []
+            for line_offset, line in lines_forward(f, offset):
+                if not line.endswith(b'\n'):
+                    # Still being written; pick it up next run
+                    break
+                batch.append((line_offset, line))
+                offset = line_offset + len(line)
+                if len(batch) >= BATCH_SIZE:
+                    indexed += self.insert_lines(file_id, batch, offset)
+                    batch = []
+            if batch:
+                indexed += self.insert_lines(file_id, batch, offset)
+            return indexed
+    
+    def clear_file(self, conn, file_id):
+        conn.execute(
+            text("DELETE FROM log_messages WHERE rowid IN (SELECT id FROM log_lines WHERE file_id = :id)"), {"id": file_id}
+        )
+        conn.execute(text("DELETE FROM log_lines WHERE file_id = :id"), {"id": file_id})
+    
+    def forget_missing(self, paths):
+        """Drop the index of containers that were removed"""
+        with self.engine.begin() as conn:
+            for row in conn.execute(text("SELECT id, path FROM log_files")).all():
+                if row.path not in paths:
+                    self.clear_file(conn, row.id)
+                    conn.execute(text("DELETE FROM log_files WHERE id = :id"), {"id": row.id})
+    
+    def insert_lines(self, file_id, batch, indexed_bytes):
+        lines = []
+        messages = []
+        with self.engine.begin() as conn:
+            # Only the indexing job writes, so ids can be handed out up front
+            # and both tables filled with one executemany each
+            line_id = conn.exec_driver_sql("SELECT coalesce(max(id), 0) FROM log_lines").scalar()
+            for line_offset, line in batch:
+                if not line.strip():
+                    continue
+                timestamp, message, stream = parse_log_line(line)
+                try:
+                    line_time = to_epoch(parse_rfc3339(timestamp))
+                except ValueError:
+                    line_time = None
+                line_id += 1
+                lines.append((line_id, file_id, line_offset, line_time, timestamp, classifier.level(message), stream))
+                messages.append((line_id, message))
+            if lines:
+                conn.exec_driver_sql(
+                    "INSERT INTO log_lines (id, file_id, offset, time, timestamp, level, stream) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    lines
+                )
+                conn.exec_driver_sql("INSERT INTO log_messages (rowid, message) VALUES (?, ?)", messages)
+            conn.execute(
+                text("UPDATE log_files SET indexed_bytes = :offset WHERE id = :id"), {"offset": indexed_bytes, "id": file_id}
+            )
+        return len(lines)
+    
+    def covers(self, path):
+        """Whether the file is indexed (lines appended since the last run are scanned at query time)"""
+        if self.engine is None:
+            return False
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                text("SELECT identity, indexed_bytes FROM log_files WHERE path = :path"), {"path": path}
+            ).first()
+        return row is not None and row.identity == f"{stat.st_dev}-{stat.st_ino}" and row.indexed_bytes <= stat.st_size
+    
+    def search(
+        self, search=None, query=None, level=None, start=None, end=None, path=None, container_name=None,
+        page=1, page_size=100, sort='newest'
+    ):
+        """Matching lines, newest first by default, one page at a time.
+        
+        search is a case-insensitive substring; query is whitespace-separated terms that
+        must all appear. With a path, lines appended after the last index run are matched
+        by scanning just that unindexed tail.
+        """
+        terms = query.split() if query else []
+        level = level.upper() if level and level.upper() != 'ALL' else None
+        conditions = []
+        params = {}
+        match_terms = []
+        # Substrings of 3+ characters are looked up in the trigram index as phrases, which
+        # also keeps % and _ literal; a LIKE with an ESCAPE clause would scan the whole table
+        substrings = {f"term{i}": term for i, term in enumerate(terms)}
+        if search:
+            substrings["search"] = search
+        for name, value in substrings.items():
+            if len(value) >= 3:
+                match_terms.append(phrase(value))
+            else:
+                conditions.append(substring_condition(name, value, params))
+        if match_terms:
+            conditions.append("log_messages MATCH :match")
+            params["match"] = " AND ".join(match_terms)
+        text_filtered = bool(conditions)
+        if level:
+            conditions.append("l.level = :level")
+            params["level"] = level
+        if start:
+            conditions.append("l.time >= :start")
+            params["start"] = to_epoch(start)
+        if end:
+            conditions.append("l.time < :end")
+            params["end"] = to_epoch(end)
+        if path:
+            conditions.append("f.path = :path")
+            params["path"] = path
+        if container_name:
+            conditions.append("f.container_name = :container_name")
+            params["container_name"] = container_name
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        if text_filtered:
+            # CROSS JOIN keeps the full-text lookup as the outer loop; otherwise SQLite may
+            # walk log_lines by time and probe the FTS table once per line
+            joins = "FROM log_messages m CROSS JOIN log_lines l ON l.id = m.rowid JOIN log_files f ON f.id = l.file_id"
+            count_joins = joins
+        else:
+            count_joins = "FROM log_lines l JOIN log_files f ON f.id = l.file_id"
+            joins = f"{count_joins} JOIN log_messages m ON m.rowid = l.id"
+        order = "DESC" if sort != 'oldest' else "ASC"
+        
+        tail = self.tail_matches(path, search, terms, level, start, end) if path else []
+        if sort != 'oldest':
+            tail.reverse()
+        
+        offset = max(page - 1, 0) * page_size
+        with self.engine.connect() as conn:
+            indexed_total = conn.execute(text(f"SELECT count(*) {count_joins} {where}"), params).scalar()
+            # Newest-first pages start with the unindexed tail; oldest-first pages end with it
+            head = tail if sort != 'oldest' else []
+            logs = head[offset:offset + page_size]
+            index_offset = max(offset - len(head), 0)
+            remaining = page_size - len(logs)
+            if remaining > 0:
+                rows = conn.execute(
+                    text(
+                        f"SELECT l.offset, l.timestamp, l.level, l.stream, m.message, f.container_name {joins} {where} "
+                        f"ORDER BY l.time {order}, l.id {order} LIMIT :limit OFFSET :offset"
+                    ),
+                    dict(params, limit=remaining, offset=index_offset)
+                ).all()
+                logs += [
+                    {
+                        'offset': row.offset,
+                        'timestamp': row.timestamp,
+                        'level': row.level,
+                        'message': row.message,
+                        'stream': row.stream,
+                        'container_name': row.container_name,
+                        'size': len(row.message)
+                    }
+                    for row in rows
+                ]
+            if sort == 'oldest' and len(logs) < page_size:
+                tail_offset = max(offset - indexed_total, 0)
+                logs += tail[tail_offset:tail_offset + page_size - len(logs)]
+        
+        total = indexed_total + len(tail)
+        return {
+            'logs': logs,
+            'total': total,
+            'page': page,
+            'page_size': page_size,
+            'total_pages': (total + page_size - 1) // page_size
+        }
+    
+    def tail_matches(self, path, search, terms, level, start, end):
+        """Matching lines of the part of a file appended since the last index run, oldest first"""
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                text("SELECT container_name, indexed_bytes FROM log_files WHERE path = :path"), {"path": path}
+            ).first()
+        if row is None:
+            return []
+        matches = []
+        with open(path, 'rb') as f:
+            for line_offset, line in lines_forward(f, row.indexed_bytes):
+                if not line.strip():
+                    continue
+                timestamp, message, stream = parse_log_line(line)
+                try:
+                    line_time = to_epoch(parse_rfc3339(timestamp))
+                except ValueError:
+                    line_time = None
+                entry = {
+                    'offset': line_offset,
+                    'timestamp': timestamp,
+                    'level': classifier.level(message),
+                    'message': message,
+                    'stream': stream,
+                    'container_name': row.container_name,
+                    'size': len(message),
+                    'time': line_time
+                }
+                if line_matches(entry, search, terms, level, start, end):
+                    del entry['time']
+                    matches.append(entry)
+        return matches
+
+log_search = LogSearchIndex(settings.log_search_db)
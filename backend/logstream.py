@@ -0,0 +1,164 @@
+from collections import deque
+from config import settings
+from hub import BroadcastHub
+from logclassify import classify_entries
+from logindex import parse_rfc3339, to_epoch
+from logreader import split_timestamp
+import docker
+import asyncio
+import json
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+class LogFollower:
+    """One logs(stream=True, follow=True) request for a container, fanned out to every viewer.
+    
+    Complete lines are classified and published as they arrive; the last few are kept
+    so a viewer who joins later starts with recent context. If the stream ends (the
+    container stopped or restarted) it is reopened from the last line seen.
+    """
+    
+    def __init__(self, manager, container_id, container_name, loop):
+        self.manager = manager
+        self.container_id = container_id
+        self.container_name = container_name
+        self.hub = BroadcastHub(settings.ws_queue_size)
+        self.hub.bind_loop(loop)
+        self.recent = deque(maxlen=settings.log_follow_backlog)
+        self.sequence = 0  # lines published so far
+        self.last_time = None
+        self.stream = None
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run, name=f"log-follow-{container_name}", daemon=True)
+    
+    def start(self):
+        self.thread.start()
+    
+    def stop(self):
+        self.stop_event.set()
+        stream = self.stream
+        if stream is not None:
+            # Unblocks the read in the follower thread
+            stream.close()
+    
+    def subscribe(self):
+        """(queue, sequence, backlog) for a new viewer; backlog is a message of the recent lines or None.
+        
+        Queue items are (sequence, message). A batch published just before the viewer
+        joined can still be delivered, so items up to the returned sequence are skipped.
+        """
+        with self.lock:
+            queue = self.hub.subscribe()
+            entries = list(self.recent)
+            sequence = self.sequence
+        return queue, sequence, self.message(entries) if entries else None
+    
+    def message(self, entries):
+        return json.dumps({'type': 'logs', 'container_name': self.container_name, 'logs': entries})
+    
+    def _run(self):
+        while not self.stop_event.is_set():
+            try:
+                self._follow()
+            except Exception as e:
+                if not self.stop_event.is_set():
+                    logger.warning(f"Log stream for {self.container_name} ended: {e}")
+            self.stop_event.wait(self.manager.retry_delay)
+    
+    def _follow(self):
+        container = self.manager.get_client().containers.get(self.container_id)
+        resume_after = self.last_time
+        if resume_after is None:
+            self.stream = container.logs(stream=True, follow=True, timestamps=True, tail=settings.log_follow_backlog)
+        else:
+            # Docker's since is whole seconds; lines already sent are skipped below
+            self.stream = container.logs(stream=True, follow=True, timestamps=True, since=int(resume_after))
+        if self.stop_event.is_set():
+            self.stream.close()
+            return
+        
+        partial = b''
+        for chunk in self.stream:
+            # A chunk can hold several lines or end mid-line
+            lines = (partial + chunk).split(b'\n')
+            partial = lines.pop()
+            entries = []
+            for line in lines:
+                line = line.decode('utf-8', errors='ignore')
+                if not line.strip():
+                    continue
+                timestamp, message = split_timestamp(line)
+                try:
+                    line_time = to_epoch(parse_rfc3339(timestamp))
+                except ValueError:
+                    line_time = None
+                if line_time is not None:
+                    if resume_after is not None:
+                        if line_time <= resume_after:
+                            continue
+                        resume_after = None
+                    self.last_time = line_time
+                entries.append((timestamp, message))
+            if not entries:
+                continue
+            logs = classify_entries(entries)
+            with self.lock:
+                self.recent.extend(logs)
+                self.sequence += len(logs)
+                self.hub.publish((self.sequence, self.message(logs)))
+
+class LogStreamManager:
+    """Followed containers and their viewers; a container's stream closes with its last viewer"""
+    
+    def __init__(self, retry_delay=2):
+        self.retry_delay = retry_delay
+        self.client = None
+        self.followers = {}  # container id -> LogFollower
+        self.client_lock = threading.Lock()
+    
+    def get_client(self):
+        # Separate from the API pool: every follow holds its connection open. No read
+        # timeout: a quiet container sends nothing for long stretches, and logs() would
+        # otherwise end its stream after docker-py's default 60s (events() sets none itself)
+        with self.client_lock:
+            if self.client is None:
+                self.client = docker.from_env(timeout=None)
+            return self.client
+    
+    async def subscribe(self, container_name):
+        """(follower, queue, sequence, backlog) for a container; must be called on the event loop.
+        
+        Raises docker.errors.NotFound for an unknown container.
+        """
+        container = await asyncio.to_thread(lambda: self.get_client().containers.get(container_name))
+        follower = self.followers.get(container.id)
+        if follower is None:
+            follower = LogFollower(self, container.id, container.name, asyncio.get_running_loop())
+            self.followers[container.id] = follower
+            follower.start()
+            logger.info(f"Following logs of {container.name}")
+        return (follower,) + follower.subscribe()
+    
+    def unsubscribe(self, follower, queue):
+        follower.hub.unsubscribe(queue)
+        if not follower.hub.has_subscribers and self.followers.get(follower.container_id) is follower:
+            del self.followers[follower.container_id]
+            follower.stop()
+            logger.info(f"Stopped following logs of {follower.container_name}")
+    
+    def stop(self):
+        for follower in list(self.followers.values()):
+            follower.stop()
+        self.followers.clear()
+    
+    def stats(self):
+        return {
+            'followed_containers': len(self.followers),
+            'viewers': sum(len(follower.hub.subscribers) for follower in self.followers.values()),
+            'dropped_messages': sum(follower.hub.dropped for follower in self.followers.values())
+        }
+
+log_streams = LogStreamManager()
@@ -1,17 +1,31 @@
-from fastapi import FastAPI, Depends, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, Depends, Query, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import and_
-from datetime import datetime, timedelta
-from typing import List
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
 from pydantic import BaseModel
-from database import get_db, HostMetric, ContainerMetric, init_db
-from collector import start_collector
+from database import get_db, init_db, ContainerSize
+from rollup import query_host_metrics, query_container_metrics, latest_series, HOST, CONTAINER
+from downsample import lttb, downsample_by_series, MIN_POINTS
+from collector import start_collector, stop_collector, scheduler
+from hub import metrics_hub
+from hotcache import hot_cache
+from dockerapi import docker_api
+from inventory import container_inventory
+from logreader import read_log_page, read_log_window, stream_lines, add_line_numbers, CursorError
+from logindex import log_indexes, parse_rfc3339, to_epoch
+from logsearch import log_search
+from logclassify import classify_entries
+from logstream import log_streams
+from logmerge import merge_logs, ndjson, file_entries, docker_entries
 from config import settings
 import logging
 import asyncio
 import docker
 import json
+import hashlib
 
 # Configure logging with proper formatting
 logging.basicConfig(
@@ -21,6 +35,12 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+def to_utc_naive(value):
+    """Query parameters may carry an offset; stored timestamps are naive UTC"""
+    if value.tzinfo:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
 # Pydantic models for API responses
 class HostMetricResponse(BaseModel):
     timestamp: datetime
@@ -32,6 +52,10 @@ class HostMetricResponse(BaseModel):
     disk_write_mb: float = 0.0
     network_in_mbit: float = 0.0
     network_out_mbit: float = 0.0
+    cpu_per_core: Optional[List[float]] = None
+    load_avg_1m: Optional[float] = None
+    load_avg_5m: Optional[float] = None
+    load_avg_15m: Optional[float] = None
     
     class Config:
         from_attributes = True
@@ -73,9 +97,19 @@ async def startup_event():
     """Initialize database and start metrics collector on startup"""
     logger.info("Starting up application...")
     init_db()
-    start_collector()
+    metrics_hub.bind_loop(asyncio.get_running_loop())
+    app.state.collector = start_collector()
+    container_inventory.start()
     logger.info("Application startup complete")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background jobs and flush buffered metrics"""
+    stop_collector(app.state.collector)
+    container_inventory.stop()
+    log_streams.stop()
+    docker_api.close()
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
@@ -93,30 +127,151 @@ async def health():
         "timestamp": datetime.utcnow().isoformat()
     }
 
+@app.get("/api/collector/status")
+async def get_collector_status():
+    """Scheduler timing for each background job: jitter, overruns and skipped ticks"""
+    return {"jobs": scheduler.stats(), "websocket": metrics_hub.stats(), "log_streams": log_streams.stats()}
+
+@app.websocket("/ws/metrics")
+async def metrics_websocket(websocket: WebSocket):
+    """Push each finished collection tick to the client as it is collected"""
+    await websocket.accept()
+    queue = metrics_hub.subscribe()
+    try:
+        while True:
+            message = await queue.get()
+            await websocket.send_text(message)
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.warning(f"Metrics websocket closed: {e}")
+    finally:
+        metrics_hub.unsubscribe(queue)
+
+@app.websocket("/ws/containers/{container_name}/logs")
+async def container_logs_websocket(websocket: WebSocket, container_name: str):
+    """Push a container's new log lines as they are written.
+    
+    All viewers of a container share one follow stream from Docker. The first message
+    holds the most recent lines; each later one holds the lines that just arrived.
+    """
+    await websocket.accept()
+    try:
+        follower, queue, sequence, backlog = await log_streams.subscribe(container_name)
+    except docker.errors.NotFound:
+        await websocket.send_text(json.dumps({'type': 'error', 'error': 'Container not found'}))
+        await websocket.close()
+        return
+    except Exception as e:
+        logger.error(f"Error following logs of {container_name}: {e}")
+        await websocket.send_text(json.dumps({'type': 'error', 'error': str(e)}))
+        await websocket.close()
+        return
+    try:
+        if backlog:
+            await websocket.send_text(backlog)
+        while True:
+            message_sequence, message = await queue.get()
+            # Already part of the backlog
+            if message_sequence <= sequence:
+                continue
+            await websocket.send_text(message)
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.warning(f"Log websocket for {container_name} closed: {e}")
+    finally:
+        log_streams.unsubscribe(follower, queue)
+
+def metrics_etag(request: Request):
+    """ETag for a metrics query, keyed on the newest collected tick and the newest committed one.
+    
+    Recent windows are served from the hot cache, which holds a tick as soon as it is
+    collected; older ones from the database, which only has it once the writer flushes.
+    """
+    collector = getattr(app.state, "collector", None)
+    if collector is None:
+        return None
+    collected, committed = hot_cache.newest_tick, collector.writer.latest_timestamp
+    if collected is None and committed is None:
+        return None
+    query = hashlib.md5(str(sorted(request.query_params.multi_items())).encode()).hexdigest()[:12]
+    ticks = "-".join(str(int(tick.timestamp())) if tick else "0" for tick in (collected, committed))
+    return f'W/"{ticks}-{collector.rollups.version}-{query}"'
+
 @app.get("/api/metrics", response_model=MetricsResponse)
-async def get_metrics(db: Session = Depends(get_db)):
+async def get_metrics(
+    request: Request,
+    response: Response,
+    since: Optional[datetime] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    container_ids: Optional[str] = None,
+    max_points: int = Query(500, ge=0),
+    resolution: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
     """
-    Get host and container metrics from the last 24 hours
+    Get host and container metrics for a time range (default: the last 24 hours).
+    Each series is downsampled with LTTB to at most max_points rows (0 disables it,
+    values below 3 are raised to 3).
+    Rows come from the coarsest rollup tier that meets resolution (seconds), which
+    defaults to the window divided by max_points.
+    With since, only raw rows newer than that timestamp are returned, for incremental polling.
+    Unchanged polls are answered with 304 via ETag / If-None-Match without touching the database.
     """
+    etag = metrics_etag(request)
+    if etag:
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = "no-cache"
+    
     try:
-        # Calculate 24 hours ago
-        time_threshold = datetime.utcnow() - timedelta(hours=24)
+        ids = [c.strip() for c in container_ids.split(",") if c.strip()] if container_ids else None
+        
+        if since:
+            # Incremental mode: raw rows strictly after the client's last timestamp
+            since = to_utc_naive(since)
+            end_time = datetime.utcnow() + timedelta(seconds=1)
+            if hot_cache.covers(since):
+                host_metrics = hot_cache.host_rows(since, end_time, inclusive_start=False)
+                container_metrics = hot_cache.container_rows(since, end_time, ids, inclusive_start=False)
+            else:
+                host_metrics = [h for h in query_host_metrics(db, since, end_time) if h["timestamp"] > since]
+                container_metrics = [
+                    c for c in query_container_metrics(db, since, end_time, container_ids=ids)
+                    if c["timestamp"] > since
+                ]
+            return MetricsResponse(
+                host_metrics=[HostMetricResponse.model_validate(h) for h in host_metrics],
+                container_metrics=[ContainerMetricResponse.model_validate(c) for c in container_metrics]
+            )
+        
+        if max_points:
+            max_points = max(max_points, MIN_POINTS)
+        end_time = to_utc_naive(end) if end else datetime.utcnow()
+        time_threshold = to_utc_naive(start) if start else end_time - timedelta(hours=24)
         
-        # Query host metrics
-        host_metrics = db.query(HostMetric).filter(
-            HostMetric.timestamp >= time_threshold
-        ).order_by(HostMetric.timestamp.asc()).all()
+        if resolution is None and hot_cache.covers(time_threshold):
+            # Recent windows are served from the in-memory ring buffers
+            host_metrics = hot_cache.host_rows(time_threshold, end_time)
+            container_metrics = hot_cache.container_rows(time_threshold, end_time, ids)
+        else:
+            if resolution is None and max_points > 0:
+                resolution = int((end_time - time_threshold).total_seconds() // max_points)
+            host_metrics = query_host_metrics(db, time_threshold, end_time, resolution)
+            container_metrics = query_container_metrics(db, time_threshold, end_time, resolution, ids)
         
-        # Query container metrics
-        container_metrics = db.query(ContainerMetric).filter(
-            ContainerMetric.timestamp >= time_threshold
-        ).order_by(ContainerMetric.timestamp.asc()).all()
+        if max_points > 0:
+            host_metrics = lttb(host_metrics, max_points)
+            container_metrics = downsample_by_series(container_metrics, max_points, key="container_id")
         
         logger.info(f"Retrieved {len(host_metrics)} host metrics and {len(container_metrics)} container metrics")
         
         return MetricsResponse(
-            host_metrics=[HostMetricResponse.from_orm(h) for h in host_metrics],
-            container_metrics=[ContainerMetricResponse.from_orm(c) for c in container_metrics]
+            host_metrics=[HostMetricResponse.model_validate(h) for h in host_metrics],
+            container_metrics=[ContainerMetricResponse.model_validate(c) for c in container_metrics]
         )
     except Exception as e:
         logger.error(f"Error retrieving metrics: {e}")
@@ -127,96 +282,116 @@ async def get_metrics(db: Session = Depends(get_db)):
 
 @app.get("/api/metrics/latest")
 async def get_latest_metrics(db: Session = Depends(get_db)):
-    """Get the most recent metrics snapshot"""
+    """Get the most recent metrics snapshot: the host and one row per reporting container"""
     try:
-        latest_host = db.query(HostMetric).order_by(HostMetric.timestamp.desc()).first()
-        latest_containers = db.query(ContainerMetric).order_by(ContainerMetric.timestamp.desc()).limit(20).all()
+        latest_host, latest_containers = hot_cache.latest()
+        
+        if latest_host is None:
+            # Nothing collected since startup yet; fall back to the newest tick on disk
+            hosts = latest_series(db, HOST)
+            latest_host = hosts[0] if hosts else None
+            latest_containers = latest_series(db, CONTAINER)
         
         return {
-            "host": HostMetricResponse.from_orm(latest_host) if latest_host else None,
-            "containers": [ContainerMetricResponse.from_orm(c) for c in latest_containers]
+            "host": HostMetricResponse.model_validate(latest_host) if latest_host else None,
+            "containers": [ContainerMetricResponse.model_validate(c) for c in latest_containers]
         }
     except Exception as e:
         logger.error(f"Error retrieving latest metrics: {e}")
         return {"host": None, "containers": []}
 
+def describe_container(attrs, image):
+    """Container summary for /api/containers/all; uptime is computed as of now"""
+    from datetime import datetime as dt, timezone
+    # Get status info
+    state = attrs['State']
+    status = state['Status']  # running, exited, created, paused, etc
+    
+    # Parse started time for UPTIME (not created time)
+    if status == 'running' and state.get('StartedAt'):
+        started_str = state['StartedAt']
+        started_dt = dt.fromisoformat(started_str.replace('Z', '+00:00'))
+        now = dt.now(timezone.utc)
+        uptime_seconds = (now - started_dt).total_seconds()
+    elif state.get('FinishedAt') and state['FinishedAt'] != '0001-01-01T00:00:00Z':
+        finished_str = state['FinishedAt']
+        finished_dt = dt.fromisoformat(finished_str.replace('Z', '+00:00'))
+        now = dt.now(timezone.utc)
+        uptime_seconds = (now - finished_dt).total_seconds()
+    else:
+        created_str = attrs['Created']
+        created_dt = dt.fromisoformat(created_str.replace('Z', '+00:00'))
+        now = dt.now(timezone.utc)
+        uptime_seconds = (now - created_dt).total_seconds()
+    
+    # Calculate uptime components
+    days = int(uptime_seconds // 86400)
+    hours = int((uptime_seconds % 86400) // 3600)
+    minutes = int((uptime_seconds % 3600) // 60)
+    
+    # Create display text based on status
+    if status == 'running':
+        uptime_display = f"{days}d {hours}h" if days > 0 else f"{hours}h {minutes}m"
+        uptime_label = "Up"
+    elif status == 'exited':
+        uptime_display = f"{days}d {hours}h" if days > 0 else f"{hours}h {minutes}m"
+        uptime_label = "Exited"
+    else:
+        uptime_display = f"{days}d {hours}h" if days > 0 else f"{hours}h {minutes}m"
+        uptime_label = "Created"
+    
+    # Get CPU and Memory from database metrics (faster than stats())
+    cpu_percent = 0.0
+    memory_mb = 0.0
+    memory_percent = 0.0
+    
+    # Only get stats for running containers, but skip to avoid blocking
+    # Frontend will get real-time metrics from /api/metrics endpoint
+    
+    return {
+        "id": attrs['Id'][:12],
+        "full_id": attrs['Id'],
+        "name": attrs['Name'].lstrip('/'),
+        "image": image,
+        "status": status,
+        "state": state['Status'],
+        "created": attrs['Created'],
+        "started_at": state.get('StartedAt', ''),
+        "finished_at": state.get('FinishedAt', ''),
+        "uptime_seconds": int(uptime_seconds),
+        "uptime_days": days,
+        "uptime_hours": hours,
+        "uptime_minutes": minutes,
+        "uptime_display": uptime_display,
+        "uptime_label": uptime_label,
+        "cpu_percent": round(cpu_percent, 2),
+        "memory_mb": round(memory_mb, 2),
+        "memory_percent": round(memory_percent, 2),
+        "ports": attrs.get('NetworkSettings', {}).get('Ports', {})
+    }
+
 @app.get("/api/containers/all")
 async def get_all_containers():
     """Get all Docker containers (running and stopped) with detailed info"""
-    import docker
-    from datetime import datetime as dt, timezone
+    if container_inventory.ready:
+        # Served from memory; the inventory follows Docker events in the background
+        try:
+            result = [describe_container(attrs, image) for attrs, image in container_inventory.snapshot()]
+            return {"containers": result, "total": len(result)}
+        except Exception as e:
+            logger.error(f"Error describing cached containers: {e}")
+    return await docker_api.run(list_all_containers)
+
+def list_all_containers():
+    """Blocking part of get_all_containers, used until the inventory has loaded; runs on the Docker API pool"""
     try:
-        docker_client = docker.from_env()
+        docker_client = docker_api.get_client()
         containers = docker_client.containers.list(all=True)
         
         result = []
         for container in containers:
-            # Get status info
-            state = container.attrs['State']
-            status = state['Status']  # running, exited, created, paused, etc
-            
-            # Parse started time for UPTIME (not created time)
-            if status == 'running' and state.get('StartedAt'):
-                started_str = state['StartedAt']
-                started_dt = dt.fromisoformat(started_str.replace('Z', '+00:00'))
-                now = dt.now(timezone.utc)
-                uptime_seconds = (now - started_dt).total_seconds()
-            elif state.get('FinishedAt') and state['FinishedAt'] != '0001-01-01T00:00:00Z':
-                finished_str = state['FinishedAt']
-                finished_dt = dt.fromisoformat(finished_str.replace('Z', '+00:00'))
-                now = dt.now(timezone.utc)
-                uptime_seconds = (now - finished_dt).total_seconds()
-            else:
-                created_str = container.attrs['Created']
-                created_dt = dt.fromisoformat(created_str.replace('Z', '+00:00'))
-                now = dt.now(timezone.utc)
-                uptime_seconds = (now - created_dt).total_seconds()
-            
-            # Calculate uptime components
-            days = int(uptime_seconds // 86400)
-            hours = int((uptime_seconds % 86400) // 3600)
-            minutes = int((uptime_seconds % 3600) // 60)
-            
-            # Create display text based on status
-            if status == 'running':
-                uptime_display = f"{days}d {hours}h" if days > 0 else f"{hours}h {minutes}m"
-                uptime_label = "Up"
-            elif status == 'exited':
-                uptime_display = f"{days}d {hours}h" if days > 0 else f"{hours}h {minutes}m"
-                uptime_label = "Exited"
-            else:
-                uptime_display = f"{days}d {hours}h" if days > 0 else f"{hours}h {minutes}m"
-                uptime_label = "Created"
-            
-            # Get CPU and Memory from database metrics (faster than stats())
-            cpu_percent = 0.0
-            memory_mb = 0.0
-            memory_percent = 0.0
-            
-            # Only get stats for running containers, but skip to avoid blocking
-            # Frontend will get real-time metrics from /api/metrics endpoint
-            
-            result.append({
-                "id": container.id[:12],
-                "full_id": container.id,
-                "name": container.name,
-                "image": container.image.tags[0] if container.image.tags else container.image.id[:12],
-                "status": status,
-                "state": state['Status'],
-                "created": container.attrs['Created'],
-                "started_at": state.get('StartedAt', ''),
-                "finished_at": state.get('FinishedAt', ''),
-                "uptime_seconds": int(uptime_seconds),
-                "uptime_days": days,
-                "uptime_hours": hours,
-                "uptime_minutes": minutes,
-                "uptime_display": uptime_display,
-                "uptime_label": uptime_label,
-                "cpu_percent": round(cpu_percent, 2),
-                "memory_mb": round(memory_mb, 2),
-                "memory_percent": round(memory_percent, 2),
-                "ports": container.attrs.get('NetworkSettings', {}).get('Ports', {})
-            })
+            image = container.image.tags[0] if container.image.tags else container.image.id[:12]
+            result.append(describe_container(container.attrs, image))
         
         return {"containers": result, "total": len(result)}
     except Exception as e:
@@ -228,26 +403,44 @@ async def get_all_containers():
 @app.get("/api/containers/{container_name}/logs")
 async def get_container_logs(container_name: str, tail: int = 100, date: str = None):
     """Get real-time logs from a specific container with optional date filter"""
+    return await docker_api.run(read_container_logs, container_name, tail, date)
+
+def read_container_logs(container_name, tail, date):
+    """Blocking part of get_container_logs; runs on the Docker API pool"""
     import docker
-    import re
+    import os
     from datetime import datetime as dt
-    from dateutil import parser as date_parser
     
     try:
-        docker_client = docker.from_env()
+        docker_client = docker_api.get_client()
         container = docker_client.containers.get(container_name)
         
-        # Get more logs if filtering by date (fetch all for accuracy)
-        # If date filter: get all logs, else use tail parameter
+        # With a date, only that UTC day is read; otherwise the last `tail` lines
+        log_path = container.attrs.get('LogPath')
+        index = None
         if date:
-            # Fetch all logs when filtering by date
-            raw_logs = container.logs(timestamps=True).decode('utf-8', errors='ignore')
+            day_start = dt.strptime(date, '%Y-%m-%d')
+            day_end = day_start + timedelta(days=1)
+            if log_path and os.access(log_path, os.R_OK):
+                index = log_indexes.get(log_path)
+        if index is not None and index.covers(day_start):
+            # Seek to the day through the log file's sidecar index instead of fetching the whole log
+            lines = (
+                f"{timestamp} {message}"
+                for timestamp, message in read_log_window(log_path, day_start, day_end, index)
+            )
+        elif date:
+            # Days rotated out of the current file are still in Docker's history; let Docker
+            # cut the day out of it and parse the body as it streams in
+            lines = stream_lines(container.logs(
+                stream=True, timestamps=True, since=int(to_epoch(day_start)), until=int(to_epoch(day_end))
+            ))
         else:
             # Fetch only tail amount for performance
-            raw_logs = container.logs(tail=tail, timestamps=True).decode('utf-8', errors='ignore')
+            lines = container.logs(tail=tail, timestamps=True).decode('utf-8', errors='ignore').split('\n')
         
-        logs = []
-        for line in raw_logs.split('\n'):
+        entries = []
+        for line in lines:
             if not line.strip():
                 continue
                 
@@ -259,44 +452,19 @@ async def get_container_logs(container_name: str, tail: int = 100, date: str = N
                 timestamp_str = datetime.utcnow().isoformat()
                 message = line
             
-            # Filter by date if provided
+            # Docker's since/until are whole seconds; keep exactly the requested day
             if date:
                 try:
-                    # Parse timestamp flexibly
-                    log_datetime = date_parser.parse(timestamp_str)
-                    log_date = log_datetime.strftime('%Y-%m-%d')
-                    
-                    # Skip if date doesn't match
-                    if log_date != date:
-                        continue
-                except Exception as e:
+                    log_datetime = parse_rfc3339(timestamp_str)
+                except ValueError as e:
                     logger.debug(f"Failed to parse timestamp {timestamp_str}: {e}")
                     continue
+                if not day_start <= log_datetime < day_end:
+                    continue
             
-            # Determine log level from message content
-            level = 'INFO'
-            details = {}
-            
-            if re.search(r'\b(error|500|502|503|504|failed|exception|fatal)\b', message, re.IGNORECASE):
-                level = 'ERROR'
-                if '500' in message or 'error' in message.lower():
-                    details['severity'] = 'high'
-                    if 'http' in message.lower():
-                        details['type'] = 'HTTP Error'
-            elif re.search(r'\b(warn|warning|deprecated)\b', message, re.IGNORECASE):
-                level = 'WARNING'
-                details['severity'] = 'medium'
-            elif re.search(r'\b(success|started|connected|ready)\b', message, re.IGNORECASE):
-                level = 'INFO'
-                details['severity'] = 'low'
-            
-            logs.append({
-                'timestamp': timestamp_str,
-                'level': level,
-                'message': message.strip(),
-                'details': details if details else None
-            })
+            entries.append((timestamp_str, message.strip()))
         
+        logs = classify_entries(entries)
         return {
             'container_name': container_name,
             'logs': logs,
@@ -312,42 +480,38 @@ async def get_container_logs(container_name: str, tail: int = 100, date: str = N
         return {"error": str(e), "logs": []}
 
 @app.get("/api/containers/stats")
-async def get_containers_stats():
-    """Get container statistics including total size"""
-    import docker
+async def get_containers_stats(db: Session = Depends(get_db)):
+    """Get container statistics including total size, as of the last background size scan"""
     try:
-        docker_client = docker.from_env()
-        containers = docker_client.containers.list(all=True)
+        sizes = db.query(ContainerSize).order_by(ContainerSize.container_name).all()
+        # Status changes more often than sizes are scanned; prefer the live inventory
+        statuses = {
+            attrs['Id']: attrs['State']['Status'] for attrs, _ in container_inventory.snapshot()
+        } if container_inventory.ready else {}
         
         total_size = 0
         container_stats = []
         
-        for container in containers:
-            try:
-                # Get container size
-                size_data = container.attrs.get('SizeRw', 0) or 0
-                root_fs = container.attrs.get('SizeRootFs', 0) or 0
-                
-                container_size = size_data + root_fs
-                total_size += container_size
-                
-                container_stats.append({
-                    'id': container.id[:12],
-                    'name': container.name,
-                    'size_bytes': container_size,
-                    'size_mb': round(container_size / (1024 * 1024), 2),
-                    'status': container.status
-                })
-            except Exception as e:
-                logger.warning(f"Error getting size for container {container.name}: {e}")
-                continue
+        for size in sizes:
+            container_size = size.size_rw + size.size_root_fs
+            total_size += container_size
+            
+            container_stats.append({
+                'id': size.container_id[:12],
+                'name': size.container_name,
+                'size_bytes': container_size,
+                'size_mb': round(container_size / (1024 * 1024), 2),
+                'status': statuses.get(size.container_id, size.status),
+                'computed_at': size.computed_at.isoformat()
+            })
         
         return {
             'total_size_bytes': total_size,
             'total_size_mb': round(total_size / (1024 * 1024), 2),
             'total_size_gb': round(total_size / (1024 * 1024 * 1024), 2),
-            'container_count': len(containers),
-            'containers': container_stats
+            'container_count': len(sizes),
+            'containers': container_stats,
+            'computed_at': max(size.computed_at for size in sizes).isoformat() if sizes else None
         }
         
     except Exception as e:
@@ -357,19 +521,24 @@ async def get_containers_stats():
             'total_size_mb': 0,
             'total_size_gb': 0,
             'container_count': 0,
-            'containers': []
+            'containers': [],
+            'computed_at': None
         }
 
 @app.get("/api/logs/files")
 async def get_log_files(container_id: str = None, container_name: str = None):
     """List log files from /var/lib/docker/containers/<container_id>/"""
+    return await docker_api.run(list_log_files, container_id, container_name)
+
+def list_log_files(container_id, container_name):
+    """Blocking part of get_log_files; runs on the Docker API pool"""
     import docker
     import os
     import glob
     from pathlib import Path
     
     try:
-        docker_client = docker.from_env()
+        docker_client = docker_api.get_client()
         log_files = []
         
         # Get all containers or specific one by ID or Name
@@ -452,13 +621,18 @@ async def read_log_file(
     level: str = None,
     search: str = None,
     sort: str = 'newest',
-    container_name: str = None
+    container_name: str = None,
+    cursor: str = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
 ):
-    """Read log file content with pagination and filtering"""
+    """Read log file content with pagination and filtering.
+    
+    Pages are read by seeking (from the end for sort=newest), so memory is bounded by
+    page_size. Pass next_cursor / prev_cursor from a response to move between pages.
+    start/end limit the page to a time window, located through the file's sidecar index.
+    """
     import os
-    import re
-    import json
-    from datetime import datetime
     
     try:
         # Security check - ensure path is within Docker containers directory
@@ -476,79 +650,33 @@ async def read_log_file(
                 'total': 0
             }
         
-        logs = []
-        
-        # Read file
-        with open(path, 'r', errors='ignore') as f:
-            lines = f.readlines()
-        
-        # Parse each line (Docker JSON log format)
-        for line_num, line in enumerate(lines):
-            if not line.strip():
-                continue
-            
-            try:
-                # Try to parse as JSON (Docker log format)
-                log_entry = json.loads(line)
-                timestamp = log_entry.get('time', datetime.utcnow().isoformat())
-                message = log_entry.get('log', '').strip()
-                stream = log_entry.get('stream', 'stdout')
-            except json.JSONDecodeError:
-                # Fallback to plain text parsing
-                timestamp = datetime.utcnow().isoformat()
-                message = line.strip()
-                stream = 'stdout'
-            
-            # Determine log level from message
-            log_level = 'INFO'
-            if re.search(r'\b(error|500|502|503|504|failed|exception|fatal|critical)\b', message, re.IGNORECASE):
-                log_level = 'ERROR'
-            elif re.search(r'\b(warn|warning|deprecated|caution)\b', message, re.IGNORECASE):
-                log_level = 'WARNING'
-            elif re.search(r'\b(debug|trace|verbose)\b', message, re.IGNORECASE):
-                log_level = 'DEBUG'
-            elif re.search(r'\b(info|success|started|connected|ready)\b', message, re.IGNORECASE):
-                log_level = 'INFO'
-            
-            # Apply level filter
-            if level and level.upper() != 'ALL' and log_level != level.upper():
-                continue
-            
-            # Apply search filter
-            if search and search.lower() not in message.lower():
-                continue
-            
-            logs.append({
-                'line_number': line_num + 1,
-                'timestamp': timestamp,
-                'level': log_level,
-                'message': message,
-                'stream': stream,
-                'container_name': container_name if container_name else 'Unknown',
-                'size': len(message)
+        if search and not cursor and settings.log_search_enabled and log_search.covers(path):
+            # Answer from the full-text index instead of scanning the file
+            result = await asyncio.to_thread(lambda: search_log_page(
+                path, search=search, level=level, page=page, page_size=page_size, sort=sort,
+                start=to_utc_naive(start) if start else None, end=to_utc_naive(end) if end else None
+            ))
+            result.update({
+                'next_cursor': None,
+                'prev_cursor': None,
+                'has_more': page < result['total_pages'],
+                'container_name': container_name
             })
+            return result
         
-        # Sort logs
-        if sort == 'oldest':
-            logs.sort(key=lambda x: x['timestamp'])
-        else:  # newest first (default)
-            logs.sort(key=lambda x: x['timestamp'], reverse=True)
-        
-        # Pagination
-        total_logs = len(logs)
-        start_idx = (page - 1) * page_size
-        end_idx = start_idx + page_size
-        paginated_logs = logs[start_idx:end_idx]
+        return await asyncio.to_thread(lambda: read_log_page(
+            path, page_size,
+            cursor=cursor, page=page, sort=sort, level=level, search=search, container_name=container_name,
+            start=to_utc_naive(start) if start else None, end=to_utc_naive(end) if end else None,
+            index=log_indexes.get(path)
+        ))
         
+    except CursorError as e:
         return {
-            'logs': paginated_logs,
-            'total': total_logs,
-            'page': page,
-            'page_size': page_size,
-            'total_pages': (total_logs + page_size - 1) // page_size,
-            'container_name': container_name
+            'error': str(e),
+            'logs': [],
+            'total': 0
         }
-        
     except Exception as e:
         logger.error(f"Error reading log file: {e}")
         return {
@@ -557,11 +685,117 @@ async def read_log_file(
             'total': 0
         }
 
+def search_log_page(path, **filters):
+    """Blocking part of a /api/logs/read search answered from the full-text index"""
+    result = log_search.search(path=path, **filters)
+    with open(path, 'rb') as f:
+        add_line_numbers(f, log_indexes.get(path), result['logs'])
+    return result
+
+@app.get("/api/logs/merged")
+async def get_merged_logs(
+    containers: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    level: str = None,
+    search: str = None,
+    limit: int = 10000
+):
+    """Logs of several containers as one time-ordered stream (NDJSON, one entry per line).
+    
+    containers is a comma-separated list of names; the window defaults to the last hour.
+    Lines are merged as they are read, so nothing is loaded in full.
+    """
+    names = [name.strip() for name in containers.split(',') if name.strip()]
+    end = to_utc_naive(end) if end else datetime.utcnow()
+    start = to_utc_naive(start) if start else end - timedelta(hours=1)
+    try:
+        sources, missing = await docker_api.run(open_log_sources, names, start, end)
+    except Exception as e:
+        logger.error(f"Error opening merged logs: {e}")
+        return {"error": str(e), "logs": []}
+    if missing:
+        return {"error": f"Container not found: {', '.join(missing)}", "logs": []}
+    
+    return StreamingResponse(
+        ndjson(merge_logs(sources, level=level, search=search, limit=limit)),
+        media_type="application/x-ndjson"
+    )
+
+def open_log_sources(names, start, end):
+    """Blocking part of get_merged_logs; runs on the Docker API pool"""
+    import os
+    
+    docker_client = docker_api.get_client()
+    sources = {}
+    missing = []
+    for name in names:
+        try:
+            container = docker_client.containers.get(name)
+        except docker.errors.NotFound:
+            missing.append(name)
+            continue
+        log_path = container.attrs.get('LogPath')
+        index = log_indexes.get(log_path) if log_path and os.access(log_path, os.R_OK) else None
+        if index is not None and index.covers(start):
+            sources[container.name] = file_entries(log_path, start, end, index)
+        else:
+            # Part of the window may be in rotated files, which Docker reads for us
+            sources[container.name] = docker_entries(container, start, end)
+    return sources, missing
+
+@app.get("/api/logs/search")
+async def search_logs(
+    q: str = None,
+    search: str = None,
+    container_name: str = None,
+    level: str = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    sort: str = 'newest',
+    page: int = 1,
+    page_size: int = 100
+):
+    """Search every container's logs through the full-text index.
+    
+    q is whitespace-separated terms that must all appear in a line; search is a plain
+    substring. Lines written since the last indexing pass are not included.
+    """
+    if not settings.log_search_enabled:
+        return {
+            'error': 'Log search index is disabled (set LOG_SEARCH_ENABLED=true)',
+            'logs': [],
+            'total': 0
+        }
+    if log_search.engine is None:
+        return {
+            'error': 'Log search index is still being built',
+            'logs': [],
+            'total': 0
+        }
+    try:
+        return await asyncio.to_thread(lambda: log_search.search(
+            search=search, query=q, level=level, container_name=container_name,
+            start=to_utc_naive(start) if start else None, end=to_utc_naive(end) if end else None,
+            page=page, page_size=page_size, sort=sort
+        ))
+    except Exception as e:
+        logger.error(f"Error searching logs: {e}")
+        return {
+            'error': str(e),
+            'logs': [],
+            'total': 0
+        }
+
 @app.get("/api/containers/{container_name}/logs/live")
 async def get_live_container_logs(container_name: str, since: str = None):
     """Get live container logs since a specific timestamp"""
+    return await docker_api.run(read_live_container_logs, container_name, since)
+
+def read_live_container_logs(container_name, since):
+    """Blocking part of get_live_container_logs; runs on the Docker API pool"""
     try:
-        docker_client = docker.from_env()
+        docker_client = docker_api.get_client()
         container = docker_client.containers.get(container_name)
 
         # Parse since timestamp
@@ -579,7 +813,7 @@ async def get_live_container_logs(container_name: str, since: str = None):
             # First call - get recent logs
             new_logs = container.logs(tail=50, timestamps=True).decode('utf-8', errors='ignore')
 
-        logs = []
+        entries = []
         for line in new_logs.split('\n'):
             if line.strip():
                 # Parse timestamp and message
@@ -590,29 +824,9 @@ async def get_live_container_logs(container_name: str, since: str = None):
                     timestamp_str = datetime.utcnow().isoformat()
                     message = line
 
-                import re
-                level = 'INFO'
-                details = {}
-
-                if re.search(r'\b(error|500|502|503|504|failed|exception|fatal)\b', message, re.IGNORECASE):
-                    level = 'ERROR'
-                    if '500' in message or 'error' in message.lower():
-                        details['severity'] = 'high'
-                        if 'http' in message.lower():
-                            details['type'] = 'HTTP Error'
-                elif re.search(r'\b(warn|warning|deprecated)\b', message, re.IGNORECASE):
-                    level = 'WARNING'
-                    details['severity'] = 'medium'
-                elif re.search(r'\b(success|started|connected|ready)\b', message, re.IGNORECASE):
-                    level = 'INFO'
-                    details['severity'] = 'low'
-
-                logs.append({
-                    'timestamp': timestamp_str,
-                    'level': level,
-                    'message': message.strip(),
-                    'details': details if details else None
-                })
+                entries.append((timestamp_str, message.strip()))
+
+        logs = classify_entries(entries)
 
         return {
             'container_name': container_name,
@@ -0,0 +1,108 @@
+from datetime import date, datetime, timedelta
+from sqlalchemy import MetaData, Table, Column, Index, inspect, insert, select, func
+import threading
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+class PartitionedTable:
+    """Routes one logical metrics table to per-day physical tables (<name>_dYYYYMMDD).
+    
+    Expiring a day is a DROP TABLE instead of a large DELETE, and range queries
+    only touch the partitions that overlap the requested window.
+    """
+    
+    def __init__(self, name, template):
+        self.name = name
+        self.template = template
+        self.metadata = MetaData()
+        self.tables = {}  # day -> Table
+        self.created = set()  # days whose partition is known to exist
+        self.pattern = re.compile(rf"^{re.escape(name)}_d(\d{{8}})$")
+        self.lock = threading.Lock()
+    
+    def partition_name(self, day):
+        return f"{self.name}_d{day.strftime('%Y%m%d')}"
+    
+    def table(self, day):
+        """Table object for a day's partition (not created in the database)"""
+        with self.lock:
+            table = self.tables.get(day)
+            if table is None:
+                name = self.partition_name(day)
+                columns = [
+                    Column(c.name, c.type, primary_key=c.primary_key, nullable=c.nullable)
+                    for c in self.template.columns
+                ]
+                table = Table(name, self.metadata, *columns, **self.template.kwargs)
+                for index in self.template.indexes:
+                    index_columns = [table.c[c.name] for c in index.columns]
+                    suffix = "_".join(c.name for c in index.columns)
+                    Index(f"ix_{name}_{suffix}", *index_columns, unique=index.unique)
+                self.tables[day] = table
+            return table
+    
+    def days(self, conn):
+        """Days that have a partition, oldest first"""
+        days = []
+        for table_name in inspect(conn).get_table_names():
+            match = self.pattern.match(table_name)
+            if match:
+                days.append(datetime.strptime(match.group(1), "%Y%m%d").date())
+        return sorted(days)
+    
+    def tables_between(self, conn, start, end):
+        """Existing partitions overlapping [start, end), oldest first"""
+        first = start.date() if start else date.min
+        last = end.date() if end else date.max
+        return [self.table(day) for day in self.days(conn) if first <= day <= last]
+    
+    def insert_rows(self, conn, rows):
+        """Insert rows into the partition of each row's day, creating partitions as needed"""
+        by_day = {}
+        for row in rows:
+            by_day.setdefault(row["timestamp"].date(), []).append(row)
+        for day, day_rows in by_day.items():
+            table = self.table(day)
+            if day not in self.created:
+                table.create(conn, checkfirst=True)
+                self.created.add(day)
+            # A repeated (series, timestamp) key is a duplicate sample, not an error
+            conn.execute(insert(table).prefix_with("OR IGNORE", dialect="sqlite"), day_rows)
+    
+    def forget_created(self):
+        """Re-check partitions before the next insert, after a rolled-back transaction may have undone their creation"""
+        with self.lock:
+            self.created.clear()
+    
+    def first_timestamp(self, conn):
+        for day in self.days(conn):
+            table = self.table(day)
+            first = conn.execute(select(func.min(table.c.timestamp))).scalar()
+            if first is not None:
+                return first
+        return None
+    
+    def days_before(self, conn, cutoff):
+        """Days whose whole partition is older than cutoff"""
+        return [
+            day for day in self.days(conn)
+            if datetime.combine(day + timedelta(days=1), datetime.min.time()) <= cutoff
+        ]
+    
+    def drop_day(self, conn, day):
+        table = self.table(day)
+        table.drop(conn)
+        with self.lock:
+            self.tables.pop(day, None)
+            self.created.discard(day)
+            # A late row for the day defines the table again
+            self.metadata.remove(table)
+    
+    def drop_before(self, conn, cutoff):
+        """Drop every partition whose whole day is older than cutoff"""
+        days = self.days_before(conn, cutoff)
+        for day in days:
+            self.drop_day(conn, day)
+        return len(days)
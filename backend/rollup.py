@@ -0,0 +1,278 @@
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import select, delete, insert, func
+from database import (
+    host_metrics, container_metrics, Container, ROLLUP_TIERS, HOST_ROLLUP_FIELDS, CONTAINER_ROLLUP_FIELDS,
+    host_rollups, container_rollups, rollup_state
+)
+from chunks import chunk_rows, first_chunk_timestamp
+from config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Rows are rolled up one day at a time so a first run over a large history stays bounded
+ROLLUP_WINDOW = timedelta(days=1)
+
+def floor_time(value, seconds):
+    """Start of the bucket of the given size that contains value"""
+    epoch = int(value.replace(tzinfo=timezone.utc).timestamp())
+    return datetime.utcfromtimestamp(epoch - epoch % seconds)
+
+def tier_retention_days(tier):
+    return {
+        "1m": settings.rollup_1m_retention_days,
+        "5m": settings.rollup_5m_retention_days,
+        "1h": settings.rollup_1h_retention_days
+    }[tier]
+
+class SeriesKind:
+    """Raw partitioned table, rollup tables and fields for one kind of series (host or container).
+    list_fields are raw-only columns holding a list of values per sample (not rolled up)."""
+    
+    def __init__(self, name, raw, rollups, fields, key_field=None, list_fields=None):
+        self.name = name
+        self.raw = raw
+        self.rollups = rollups
+        self.fields = fields
+        self.key_field = key_field
+        self.list_fields = list_fields or []
+
+HOST = SeriesKind("host", host_metrics, host_rollups, HOST_ROLLUP_FIELDS, list_fields=["cpu_per_core"])
+CONTAINER = SeriesKind("container", container_metrics, container_rollups, CONTAINER_ROLLUP_FIELDS, "container_key")
+
+class RollupJob:
+    """Incrementally maintains the 1m/5m/1h min/avg/max/last rollup tiers"""
+    
+    def __init__(self, engine):
+        self.engine = engine
+        self.version = 0  # bumped whenever new buckets are written
+    
+    def run(self):
+        """Roll each tier forward to its last complete bucket"""
+        # Leave room for rows still buffered by the writer
+        source_end = datetime.utcnow() - timedelta(
+            seconds=settings.collection_interval + settings.write_flush_latency
+        )
+        source_tier = None
+        for tier, size in ROLLUP_TIERS:
+            source_end = self.roll_tier(tier, size, source_tier, source_end)
+            if source_end is None:
+                return
+            source_tier = tier
+    
+    def roll_tier(self, tier, size, source_tier, source_end):
+        """Aggregate source rows up to source_end into tier; returns the new watermark"""
+        with self.engine.connect() as conn:
+            watermark = conn.execute(
+                select(rollup_state.c.watermark).where(rollup_state.c.tier == tier)
+            ).scalar()
+            if watermark is None:
+                first = self.first_timestamp(conn, source_tier)
+                if first is None:
+                    return None
+                watermark = floor_time(first, size)
+        
+        end = floor_time(source_end, size)
+        buckets = 0
+        while watermark < end:
+            window_end = min(end, watermark + ROLLUP_WINDOW)
+            with self.engine.begin() as conn:
+                for kind in (HOST, CONTAINER):
+                    rows = self.aggregate(conn, kind, source_tier, watermark, window_end, size)
+                    if rows:
+                        conn.execute(insert(kind.rollups[tier]), rows)
+                        buckets += len(rows)
+                self.save_watermark(conn, tier, window_end)
+            watermark = window_end
+        
+        if buckets:
+            self.version += 1
+            logger.info(f"Rolled up {buckets} {tier} buckets (watermark {watermark.isoformat()})")
+        return watermark
+    
+    def first_timestamp(self, conn, source_tier):
+        firsts = []
+        for kind in (HOST, CONTAINER):
+            if source_tier is None:
+                candidates = [kind.raw.first_timestamp(conn), first_chunk_timestamp(conn, kind)]
+                candidates = [value for value in candidates if value is not None]
+                first = min(candidates) if candidates else None
+            else:
+                first = conn.execute(select(func.min(kind.rollups[source_tier].c.bucket))).scalar()
+            if first is not None:
+                firsts.append(first)
+        return min(firsts) if firsts else None
+    
+    def save_watermark(self, conn, tier, watermark):
+        updated = conn.execute(
+            rollup_state.update().where(rollup_state.c.tier == tier).values(watermark=watermark)
+        ).rowcount
+        if not updated:
+            conn.execute(insert(rollup_state).values(tier=tier, watermark=watermark))
+    
+    def source_rows(self, conn, kind, source_tier, start, end):
+        """Yield (series key, timestamp, count, {field: (min, avg, max, last)}) in time order"""
+        if source_tier is None:
+            rows = chunk_rows(conn, kind, start, end)
+            for table in kind.raw.tables_between(conn, start, end):
+                columns = [table.c.timestamp] + [table.c[f] for f in kind.fields]
+                if kind.key_field:
+                    columns.append(table.c[kind.key_field])
+                query = select(*columns).where(table.c.timestamp >= start, table.c.timestamp < end).order_by(table.c.timestamp)
+                rows.extend(row._mapping for row in conn.execute(query))
+            for row in sorted(rows, key=lambda row: row["timestamp"]):
+                values = {f: (row[f], row[f], row[f], row[f]) for f in kind.fields}
+                key = row[kind.key_field] if kind.key_field else None
+                yield key, row["timestamp"], 1, values
+        else:
+            table = kind.rollups[source_tier]
+            query = select(table).where(table.c.bucket >= start, table.c.bucket < end).order_by(table.c.bucket)
+            for row in conn.execute(query):
+                row = row._mapping
+                values = {
+                    f: (row[f"{f}_min"], row[f"{f}_avg"], row[f"{f}_max"], row[f"{f}_last"])
+                    for f in kind.fields
+                }
+                key = row[kind.key_field] if kind.key_field else None
+                yield key, row["bucket"], row["sample_count"], values
+    
+    def aggregate(self, conn, kind, source_tier, start, end, size):
+        """Fold source rows in [start, end) into one rollup row per series per bucket"""
+        buckets = {}
+        for key, timestamp, count, values in self.source_rows(conn, kind, source_tier, start, end):
+            bucket_key = (key, floor_time(timestamp, size))
+            acc = buckets.get(bucket_key)
+            if acc is None:
+                acc = buckets[bucket_key] = {"count": 0, "fields": {}}
+            acc["count"] += count
+            for field, (low, avg, high, last) in values.items():
+                if avg is None:
+                    continue
+                stats = acc["fields"].get(field)
+                if stats is None:
+                    acc["fields"][field] = [low, avg * count, count, high, last]
+                else:
+                    stats[0] = min(stats[0], low)
+                    stats[1] += avg * count
+                    stats[2] += count
+                    stats[3] = max(stats[3], high)
+                    stats[4] = last
+        
+        rows = []
+        for (key, bucket), acc in buckets.items():
+            row = {"bucket": bucket, "sample_count": acc["count"]}
+            if kind.key_field:
+                row[kind.key_field] = key
+            for field in kind.fields:
+                stats = acc["fields"].get(field)
+                row[f"{field}_min"] = stats[0] if stats else None
+                row[f"{field}_avg"] = stats[1] / stats[2] if stats else None
+                row[f"{field}_max"] = stats[3] if stats else None
+                row[f"{field}_last"] = stats[4] if stats else None
+            rows.append(row)
+        return rows
+    
+    def cleanup(self):
+        """Apply each tier's own retention"""
+        with self.engine.begin() as conn:
+            for tier, _ in ROLLUP_TIERS:
+                cutoff = datetime.utcnow() - timedelta(days=tier_retention_days(tier))
+                deleted = 0
+                for kind in (HOST, CONTAINER):
+                    table = kind.rollups[tier]
+                    deleted += conn.execute(delete(table).where(table.c.bucket < cutoff)).rowcount
+                if deleted:
+                    logger.info(f"Cleaned up {deleted} {tier} rollup rows")
+
+def pick_tier(start, resolution):
+    """Coarsest tier whose bucket still meets the resolution, falling back to a coarser
+    tier when its retention does not reach back to start. None means raw rows."""
+    if not resolution:
+        return None
+    fine_enough = [size for _, size in ROLLUP_TIERS if size <= resolution]
+    if not fine_enough:
+        return None
+    
+    chosen = None
+    for tier, size in ROLLUP_TIERS[len(fine_enough) - 1:]:
+        chosen = (tier, size)
+        if datetime.utcnow() - timedelta(days=tier_retention_days(tier)) <= start:
+            break
+    return chosen
+
+def series_query(kind, table, time_column, start, end, keys=None):
+    """Select rows of a raw or rollup table in [start, end); container rows carry their id and name"""
+    if not kind.key_field:
+        query = select(table)
+    else:
+        containers = Container.__table__
+        query = select(table, containers.c.container_id, containers.c.container_name).join(
+            containers, containers.c.id == table.c[kind.key_field]
+        )
+        if keys:
+            query = query.where(containers.c.container_id.in_(keys))
+    return query.where(time_column >= start, time_column < end).order_by(time_column)
+
+def query_series(db, kind, start, end, resolution=None, keys=None):
+    """Rows for [start, end) at the coarsest tier that meets resolution; raw rows past the tier's watermark.
+    keys optionally limits container series to the given container ids."""
+    chosen = pick_tier(start, resolution)
+    rows = []
+    raw_start = start
+    
+    if chosen:
+        tier, _ = chosen
+        table = kind.rollups[tier]
+        watermark = db.execute(
+            select(rollup_state.c.watermark).where(rollup_state.c.tier == tier)
+        ).scalar()
+        if watermark is not None:
+            query = series_query(kind, table, table.c.bucket, start, min(end, watermark), keys)
+            for row in db.execute(query):
+                row = row._mapping
+                item = {"timestamp": row["bucket"]}
+                if kind.key_field:
+                    item["container_id"] = row["container_id"]
+                    item["container_name"] = row["container_name"]
+                for field in kind.fields:
+                    item[field] = row[f"{field}_avg"]
+                rows.append(item)
+            raw_start = max(start, watermark)
+    
+    # Compacted days come back from chunks; partitions are whole days, so
+    # concatenating them in day order keeps rows in time order
+    raw_rows = chunk_rows(db.connection(), kind, raw_start, end, keys)
+    compacted = bool(raw_rows)
+    for table in kind.raw.tables_between(db.connection(), raw_start, end):
+        query = series_query(kind, table, table.c.timestamp, raw_start, end, keys)
+        raw_rows.extend(dict(row._mapping) for row in db.execute(query))
+    if compacted:
+        raw_rows.sort(key=lambda row: row["timestamp"])
+    rows.extend(raw_rows)
+    return rows
+
+def latest_series(db, kind):
+    """Newest row of every series of a kind on disk, within one collection interval of the newest row.
+    Samples of one tick can be stamped a few seconds apart, so the newest second alone is not enough."""
+    conn = db.connection()
+    for table in reversed(kind.raw.tables_between(conn, None, None)):
+        newest = db.execute(select(func.max(table.c.timestamp))).scalar()
+        if newest is None:
+            continue
+        # Timestamps are whole seconds: (newest - interval, newest] holds one sample per series
+        start = newest - timedelta(seconds=settings.collection_interval - 1)
+        end = newest + timedelta(seconds=1)
+        latest = {}
+        for recent in kind.raw.tables_between(conn, start, end):
+            for row in db.execute(series_query(kind, recent, recent.c.timestamp, start, end)):
+                row = dict(row._mapping)
+                # Rows come oldest first, so the newest of each series is kept
+                latest[row[kind.key_field] if kind.key_field else None] = row
+        return list(latest.values())
+    return []
+
+def query_host_metrics(db, start, end, resolution=None):
+    return query_series(db, HOST, start, end, resolution)
+
+def query_container_metrics(db, start, end, resolution=None, container_ids=None):
+    return query_series(db, CONTAINER, start, end, resolution, container_ids)
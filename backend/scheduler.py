@@ -0,0 +1,102 @@
+from datetime import datetime
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+class ScheduledJob:
+    """A periodic job that fires on wall-clock ticks aligned to its interval"""
+    
+    def __init__(self, name, interval, func):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self.next_run = None
+        self.runs = 0
+        self.failures = 0
+        self.overruns = 0
+        self.skipped_ticks = 0
+        self.last_jitter = 0.0
+        self.max_jitter = 0.0
+        self.total_jitter = 0.0
+        self.last_duration = 0.0
+        self.max_duration = 0.0
+    
+    def first_tick(self, now):
+        """Next wall-clock time that is a whole multiple of the interval"""
+        return (int(now // self.interval) + 1) * self.interval
+    
+    def record_run(self, scheduled, started, finished):
+        """Update jitter and duration statistics for one run"""
+        jitter = started - scheduled
+        duration = finished - started
+        self.runs += 1
+        self.last_jitter = jitter
+        self.max_jitter = max(self.max_jitter, jitter)
+        self.total_jitter += jitter
+        self.last_duration = duration
+        self.max_duration = max(self.max_duration, duration)
+    
+    def stats(self):
+        return {
+            'interval_seconds': self.interval,
+            'runs': self.runs,
+            'failures': self.failures,
+            'overruns': self.overruns,
+            'skipped_ticks': self.skipped_ticks,
+            'last_jitter_ms': round(self.last_jitter * 1000, 2),
+            'max_jitter_ms': round(self.max_jitter * 1000, 2),
+            'mean_jitter_ms': round(self.total_jitter / self.runs * 1000, 2) if self.runs else 0.0,
+            'last_duration_ms': round(self.last_duration * 1000, 2),
+            'max_duration_ms': round(self.max_duration * 1000, 2),
+            'next_run': datetime.utcfromtimestamp(self.next_run).isoformat() if self.next_run else None
+        }
+
+class Scheduler:
+    """Runs each job on its own thread at aligned ticks, coalescing missed ticks"""
+    
+    def __init__(self):
+        self.jobs = {}
+        self.stop_event = threading.Event()
+    
+    def add_job(self, name, interval, func):
+        self.jobs[name] = ScheduledJob(name, interval, func)
+    
+    def start(self):
+        for job in self.jobs.values():
+            thread = threading.Thread(target=self._run_job, args=(job,), name=f"scheduler-{job.name}", daemon=True)
+            thread.start()
+            logger.info(f"Scheduled job '{job.name}' every {job.interval}s")
+    
+    def stop(self):
+        self.stop_event.set()
+    
+    def _run_job(self, job):
+        job.next_run = job.first_tick(time.time())
+        
+        while not self.stop_event.is_set():
+            delay = job.next_run - time.time()
+            if delay > 0 and self.stop_event.wait(delay):
+                break
+            
+            started = time.time()
+            try:
+                job.func()
+            except Exception as e:
+                job.failures += 1
+                logger.error(f"Error in scheduled job '{job.name}': {e}")
+            finished = time.time()
+            job.record_run(job.next_run, started, finished)
+            
+            job.next_run += job.interval
+            if finished >= job.next_run:
+                # Overran into later ticks: skip them and resume on the next aligned tick
+                missed = int((finished - job.next_run) // job.interval) + 1
+                job.overruns += 1
+                job.skipped_ticks += missed
+                job.next_run += missed * job.interval
+                logger.warning(f"Job '{job.name}' took {finished - started:.2f}s, skipped {missed} tick(s)")
+    
+    def stats(self):
+        return {name: job.stats() for name, job in self.jobs.items()}
@@ -0,0 +1,83 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from sqlalchemy import select, insert, delete
+from database import ContainerSize
+from hotcache import hot_cache
+from config import settings
+import docker
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+def inspect_with_size(api, container_id):
+    """docker inspect --size: inspect_container() has no size argument, so the query is made directly"""
+    return api._result(api._get(api._url("/containers/{0}/json", container_id), params={'size': 1}), True)
+
+class SizeScanner:
+    """Refreshes container disk sizes in the background and stores them in container_sizes.
+    
+    A size-enabled inspect walks the container's whole writable layer, so scans run at
+    a slow cadence, a few containers at a time, and are skipped while the host is busy.
+    """
+    
+    def __init__(self, engine, concurrency):
+        self.engine = engine
+        self.concurrency = concurrency
+        self.client = None
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="container-size")
+        self.running = threading.Lock()
+    
+    def has_results(self):
+        with self.engine.connect() as conn:
+            return conn.execute(select(ContainerSize.container_id).limit(1)).first() is not None
+    
+    def run(self):
+        """Scan every container once; a scan already in progress makes this a no-op"""
+        if not self.running.acquire(blocking=False):
+            return
+        try:
+            host, _ = hot_cache.latest()
+            if host and (host.get('cpu_percent') or 0) > settings.size_scan_max_cpu:
+                logger.info(f"Skipping container size scan, host CPU at {host['cpu_percent']}%")
+                return
+            self.scan()
+        except Exception as e:
+            logger.error(f"Error scanning container sizes: {e}")
+        finally:
+            self.running.release()
+    
+    def scan(self):
+        started = time.time()
+        if self.client is None:
+            self.client = docker.from_env(max_pool_size=self.concurrency)
+        containers = self.client.api.containers(all=True)
+        
+        rows = [row for row in self.executor.map(self.inspect_size, containers) if row]
+        table = ContainerSize.__table__
+        with self.engine.begin() as conn:
+            if rows:
+                conn.execute(insert(table).prefix_with("OR REPLACE", dialect="sqlite"), rows)
+            # Forget containers that no longer exist
+            conn.execute(delete(table).where(table.c.container_id.notin_([c['Id'] for c in containers])))
+        logger.info(f"Scanned sizes of {len(rows)}/{len(containers)} containers in {time.time() - started:.2f}s")
+    
+    def inspect_size(self, summary):
+        try:
+            attrs = inspect_with_size(self.client.api, summary['Id'])
+            return {
+                'container_id': attrs['Id'],
+                'container_name': attrs['Name'].lstrip('/'),
+                'status': attrs['State']['Status'],
+                'size_rw': attrs.get('SizeRw', 0) or 0,
+                'size_root_fs': attrs.get('SizeRootFs', 0) or 0,
+                'computed_at': datetime.utcnow()
+            }
+        except Exception as e:
+            # Keep the previous size for this container until the next scan
+            logger.warning(f"Error getting size for container {summary['Id'][:12]}: {e}")
+            return None
+    
+    def stop(self):
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,46 @@
+from unittest import mock
+from sqlalchemy import create_engine, select
+from database import Base, ContainerSize
+from sizes import SizeScanner
+import docker
+import json
+import requests
+
+CONTAINER_ID = "a" * 64
+
+def json_response(url, payload):
+    response = requests.Response()
+    response.status_code = 200
+    response.url = url
+    response._content = json.dumps(payload).encode()
+    return response
+
+def test_scan_stores_sizes_from_a_size_enabled_inspect():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    # A real APIClient with only the HTTP round trip stubbed, so call signatures are docker-py's own
+    api = docker.APIClient(base_url="tcp://127.0.0.1:2375", version="1.44")
+    requests_made = []
+    
+    def fake_get(url, **kwargs):
+        requests_made.append((url, kwargs.get('params')))
+        return json_response(url, {
+            'Id': CONTAINER_ID,
+            'Name': '/web',
+            'State': {'Status': 'running'},
+            'SizeRw': 1024,
+            'SizeRootFs': 4096
+        })
+    
+    scanner = SizeScanner(engine, 1)
+    scanner.client = mock.Mock(api=api)
+    with mock.patch.object(api, 'containers', return_value=[{'Id': CONTAINER_ID}]), \
+            mock.patch.object(api, 'get', side_effect=fake_get):
+        scanner.scan()
+    scanner.stop()
+    
+    assert requests_made[0][0].endswith(f"/containers/{CONTAINER_ID}/json")
+    assert requests_made[0][1] == {'size': 1}
+    with engine.connect() as conn:
+        row = conn.execute(select(ContainerSize.__table__)).one()._mapping
+    assert (row['container_name'], row['status'], row['size_rw'], row['size_root_fs']) == ('web', 'running', 1024, 4096)
@@ -0,0 +1,104 @@
+from sqlalchemy import insert
+from partitions import PartitionedTable
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+class MetricsWriter:
+    """Buffers metric rows and writes them with one bulk INSERT per table in a single transaction.
+    
+    A batch that fails to write is put back in the buffer and retried on the next flush;
+    past max_rows buffered rows the oldest are dropped, so a persistent error cannot
+    grow the buffer without bound.
+    """
+    
+    def __init__(self, engine, flush_size, flush_latency, max_rows=None):
+        self.engine = engine
+        self.flush_size = flush_size
+        self.flush_latency = flush_latency
+        self.max_rows = max_rows
+        self.buffers = {}  # table -> list of row dicts
+        self.pending = 0
+        self.oldest_row_at = None
+        self.latest_timestamp = None  # newest row timestamp committed to the database
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+    
+    def add(self, table, rows):
+        """Queue rows for a table; nothing is written until the next flush"""
+        if not rows:
+            return
+        with self.lock:
+            self.buffers.setdefault(table, []).extend(rows)
+            self.pending += len(rows)
+            if self.oldest_row_at is None:
+                self.oldest_row_at = time.time()
+            self.trim()
+    
+    def trim(self):
+        """Drop the oldest buffered rows beyond max_rows; called with self.lock held"""
+        if not self.max_rows or self.pending <= self.max_rows:
+            return
+        excess = self.pending - self.max_rows
+        dropped = 0
+        # Each table's rows are in arrival order, so the oldest row overall heads one of the lists
+        while dropped < excess:
+            rows = min((rows for rows in self.buffers.values() if rows), key=lambda rows: rows[0]['timestamp'])
+            rows.pop(0)
+            dropped += 1
+        self.buffers = {table: rows for table, rows in self.buffers.items() if rows}
+        self.pending -= dropped
+        logger.warning(f"Metric write buffer over {self.max_rows} rows, dropped the {dropped} oldest")
+    
+    def requeue(self, buffers, pending, oldest_row_at):
+        """Put a failed batch back ahead of rows added while it was being written"""
+        with self.lock:
+            for table, rows in buffers.items():
+                self.buffers[table] = rows + self.buffers.get(table, [])
+            self.pending += pending
+            self.oldest_row_at = oldest_row_at
+            self.trim()
+    
+    def should_flush(self):
+        with self.lock:
+            if not self.pending:
+                return False
+            return self.pending >= self.flush_size or time.time() - self.oldest_row_at >= self.flush_latency
+    
+    def maybe_flush(self):
+        """Flush when the buffer reaches flush_size rows or its oldest row reaches flush_latency seconds"""
+        if self.should_flush():
+            self.flush()
+    
+    def flush(self):
+        """Write every buffered row in one transaction"""
+        with self.flush_lock:
+            with self.lock:
+                buffers, self.buffers = self.buffers, {}
+                pending, self.pending = self.pending, 0
+                oldest_row_at, self.oldest_row_at = self.oldest_row_at, None
+            
+            if not pending:
+                return
+            
+            started = time.time()
+            try:
+                with self.engine.begin() as conn:
+                    for table, rows in buffers.items():
+                        if isinstance(table, PartitionedTable):
+                            table.insert_rows(conn, rows)
+                        else:
+                            # A repeated (series, timestamp) key is a duplicate sample, not an error
+                            conn.execute(insert(table).prefix_with("OR IGNORE", dialect="sqlite"), rows)
+                flushed_latest = max(row['timestamp'] for rows in buffers.values() for row in rows)
+                if self.latest_timestamp is None or flushed_latest > self.latest_timestamp:
+                    self.latest_timestamp = flushed_latest
+                logger.info(f"Flushed {pending} metric rows in {(time.time() - started) * 1000:.1f}ms")
+            except Exception as e:
+                logger.error(f"Error flushing {pending} metric rows, keeping them for the next flush: {e}")
+                for table in buffers:
+                    if isinstance(table, PartitionedTable):
+                        table.forget_created()
+                self.requeue(buffers, pending, oldest_row_at)
@@ -32,7 +32,6 @@ function App() {
   const [realTimeLogs, setRealTimeLogs] = useState(false); // Toggle real-time WebSocket streaming
   const logsEndRef = useRef(null); // Ref for auto-scroll to top
   const wsRef = useRef(null); // WebSocket reference
-  const lastLogTimestampRef = useRef(null); // Track last log timestamp for polling
 
   useEffect(() => {
     if (hostMetrics.length > 0) {
@@ -145,41 +144,31 @@ function App() {
     }
   }, [showLogs, selectedContainer, selectedLogDate]);
 
-  // Real-time logs polling
+  // Real-time logs pushed over a websocket; all viewers of a container share one Docker follow stream
   useEffect(() => {
     if (showLogs && selectedContainer && realTimeLogs) {
       const containerName = selectedContainer.name || selectedContainer.container_name;
-
-      const pollLogs = async () => {
-        try {
-          const response = await fetch(`${API_BASE_URL}/api/containers/${containerName}/logs/live?since=${encodeURIComponent(lastLogTimestampRef.current || '')}`);
-          if (response.ok) {
-            const data = await response.json();
-            if (data.logs && data.logs.length > 0) {
-              // Add new logs to the beginning (newest first)
-              setContainerLogs(prevLogs => [...data.logs, ...prevLogs]);
-
-              // Update the last timestamp for next poll
-              if (data.latest_timestamp) {
-                lastLogTimestampRef.current = data.latest_timestamp;
-              }
-            }
-          }
-        } catch (error) {
-          console.error('Error polling logs:', error);
+      const base = API_BASE_URL || window.location.origin;
+      const socket = new WebSocket(`${base.replace(/^http/, 'ws')}/ws/containers/${encodeURIComponent(containerName)}/logs`);
+
+      socket.onmessage = (event) => {
+        const message = JSON.parse(event.data);
+        if (message.type === 'logs' && message.logs.length > 0) {
+          // Lines arrive oldest first; the list shows newest first
+          setContainerLogs(prevLogs => [...[...message.logs].reverse(), ...prevLogs]);
+        } else if (message.type === 'error') {
+          console.error('Error streaming logs:', message.error);
         }
       };
+      socket.onerror = (error) => {
+        console.error('Log stream error:', error);
+      };
+      wsRef.current = socket;
 
-      // Initial poll to get recent logs
-      pollLogs();
-
-      // Set up polling interval
-      const interval = setInterval(pollLogs, 2000); // Poll every 2 seconds
-
-      return () => clearInterval(interval);
-    } else {
-      // Reset timestamp when real-time is disabled
-      lastLogTimestampRef.current = null;
+      return () => {
+        socket.close();
+        wsRef.current = null;
+      };
     }
   }, [showLogs, selectedContainer, realTimeLogs]);
 
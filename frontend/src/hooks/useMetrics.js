@@ -1,20 +1,67 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import API_BASE_URL from '../config/api';
 
+const WINDOW_MS = 24 * 60 * 60 * 1000;
+
+const metricsSocketUrl = () => {
+  const base = API_BASE_URL || window.location.origin;
+  return `${base.replace(/^http/, 'ws')}/ws/metrics`;
+};
+
+// Backend timestamps are naive UTC ISO strings
+const toMillis = (timestamp) => new Date(timestamp.endsWith('Z') ? timestamp : `${timestamp}Z`).getTime();
+
+const trimWindow = (rows) => {
+  const cutoff = Date.now() - WINDOW_MS;
+  return rows.filter(row => toMillis(row.timestamp) >= cutoff);
+};
+
 export const useMetrics = () => {
   const [hostMetrics, setHostMetrics] = useState([]);
   const [containerMetrics, setContainerMetrics] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
+  // Newest timestamp we hold; polls after the first only ask for rows after it
+  const lastTimestampRef = useRef(null);
+  const socketOpenRef = useRef(false);
+
+  const latestTimestamp = (data) => {
+    const timestamps = [...(data.host_metrics || []), ...(data.container_metrics || [])].map(m => m.timestamp);
+    return timestamps.reduce((latest, ts) => (!latest || toMillis(ts) > toMillis(latest) ? ts : latest), lastTimestampRef.current);
+  };
 
-  const fetchMetrics = async () => {
+  const appendRows = (data) => {
+    const isNew = (row) => !lastTimestampRef.current || toMillis(row.timestamp) > toMillis(lastTimestampRef.current);
+    const hostRows = (data.host_metrics || []).filter(isNew);
+    const containerRows = (data.container_metrics || []).filter(isNew);
+    if (hostRows.length > 0) {
+      setHostMetrics(prev => trimWindow([...prev, ...hostRows]));
+    }
+    if (containerRows.length > 0) {
+      setContainerMetrics(prev => trimWindow([...prev, ...containerRows]));
+    }
+    lastTimestampRef.current = latestTimestamp({ host_metrics: hostRows, container_metrics: containerRows });
+  };
+
+  const fetchMetrics = async ({ full = false } = {}) => {
     try {
-      const response = await fetch(`${API_BASE_URL}/api/metrics`);
+      const since = full ? null : lastTimestampRef.current;
+      const url = since
+        ? `${API_BASE_URL}/api/metrics?since=${encodeURIComponent(since)}`
+        : `${API_BASE_URL}/api/metrics`;
+      // The backend sends an ETag with Cache-Control: no-cache, so the browser
+      // revalidates and an unchanged poll comes back as 304 from the cache
+      const response = await fetch(url);
       if (!response.ok) throw new Error('Failed to fetch metrics');
-      
+
       const data = await response.json();
-      setHostMetrics(data.host_metrics || []);
-      setContainerMetrics(data.container_metrics || []);
+      if (since) {
+        appendRows(data);
+      } else {
+        setHostMetrics(data.host_metrics || []);
+        setContainerMetrics(data.container_metrics || []);
+        lastTimestampRef.current = latestTimestamp(data);
+      }
       setError(null);
     } catch (err) {
       console.error('Error fetching metrics:', err);
@@ -25,13 +72,43 @@ export const useMetrics = () => {
   };
 
   useEffect(() => {
-    fetchMetrics();
-    
-    // Fetch every 30 seconds
-    const interval = setInterval(fetchMetrics, 30000);
-    
-    return () => clearInterval(interval);
+    fetchMetrics({ full: true });
+
+    // Live ticks are pushed over the websocket; reconnect if it drops
+    let socket = null;
+    let reconnectTimer = null;
+    let closed = false;
+
+    const connect = () => {
+      socket = new WebSocket(metricsSocketUrl());
+      socket.onopen = () => {
+        socketOpenRef.current = true;
+        // Catch up on anything collected while disconnected
+        fetchMetrics();
+      };
+      socket.onmessage = (event) => {
+        const message = JSON.parse(event.data);
+        if (message.type === 'tick') appendRows(message);
+      };
+      socket.onclose = () => {
+        socketOpenRef.current = false;
+        if (!closed) reconnectTimer = setTimeout(connect, 5000);
+      };
+    };
+    connect();
+
+    // Poll for new rows every 30 seconds only while the socket is down
+    const interval = setInterval(() => {
+      if (!socketOpenRef.current) fetchMetrics();
+    }, 30000);
+
+    return () => {
+      closed = true;
+      clearInterval(interval);
+      clearTimeout(reconnectTimer);
+      if (socket) socket.close();
+    };
   }, []);
 
-  return { hostMetrics, containerMetrics, loading, error, refetch: fetchMetrics };
+  return { hostMetrics, containerMetrics, loading, error, refetch: () => fetchMetrics({ full: true }) };
 };